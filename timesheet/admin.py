@@ -1,18 +1,94 @@
-from django.contrib import admin
-from .models import Employee, Project, Task, Timesheet
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.utils import timezone
+from django.utils.functional import cached_property
+from .approval import change_status
+from .models import Employee, EmployeeRate, Project, Task, Timesheet
+from .rates import set_rate
+
+# Админка рассчитана на большие таблицы: связанные объекты подгружаются
+# JOIN'ом (list_select_related), внешние ключи выбираются поиском
+# (autocomplete_fields) вместо <select> на всю таблицу
+
+# Сколько строк админка считает точно; больше — показывает "10000+"
+# (шаблон admin/timesheet/timesheet/pagination.html)
+ADMIN_COUNT_LIMIT = 10000
+
+
+class CappedCountPaginator(Paginator):
+    """
+    Пагинатор, который не считает всю таблицу: COUNT по подзапросу с LIMIT
+    останавливается на ADMIN_COUNT_LIMIT строках, а capped отмечает, что строк больше.
+    Страниц дальше предела не видно — к старым записям ведут фильтры и поиск.
+    """
+    capped = False
+
+    @cached_property
+    def count(self):
+        limit = getattr(settings, 'ADMIN_COUNT_LIMIT', ADMIN_COUNT_LIMIT)
+        # Одна строка сверх предела — чтобы отличить "ровно limit" от "больше"
+        count = self.object_list.values('pk')[:limit + 1].count()
+        self.capped = count > limit
+        return min(count, limit)
+
+
+class EmployeeRateInline(admin.TabularInline):
+    model = EmployeeRate
+    extra = 0
 
 @admin.register(Employee)
 class EmployeeAdmin(admin.ModelAdmin):
-    pass
+    list_display = ['user', 'hourly_rate']
+    list_select_related = ['user']
+    search_fields = ['user__username', 'user__first_name', 'user__last_name']
+    autocomplete_fields = ['user']
+    inlines = [EmployeeRateInline]
+
+    def save_model(self, request, obj, form, change):
+        # Смена текущей ставки открывает новый интервал в истории с сегодняшнего дня
+        if change and 'hourly_rate' in form.changed_data:
+            new_rate = obj.hourly_rate
+            obj.hourly_rate = form.initial['hourly_rate']
+            super().save_model(request, obj, form, change)
+            set_rate(obj, new_rate, timezone.localdate())
+        else:
+            super().save_model(request, obj, form, change)
 
 @admin.register(Project)
 class ProjectAdmin(admin.ModelAdmin):
-    pass
+    list_display = ['name']
+    search_fields = ['name']
+    autocomplete_fields = ['employees']
 
 @admin.register(Task)
 class TaskAdmin(admin.ModelAdmin):
-    pass
+    list_display = ['name', 'project']
+    list_select_related = ['project']
+    search_fields = ['name', 'project__name']
+    autocomplete_fields = ['project']
 
 @admin.register(Timesheet)
 class TimesheetAdmin(admin.ModelAdmin):
-    list_display = ['employee', 'date', 'hours', 'status']
\ No newline at end of file
+    list_display = ['employee', 'date', 'task', 'hours', 'status']
+    list_select_related = ['employee__user', 'task__project']
+    autocomplete_fields = ['employee', 'task']
+    # Фильтры по статусу и периоду (сегодня, 7 дней, месяц, год) — диапазоны по
+    # индексам (status, date) и (date, id). date_hierarchy не используем: он на
+    # каждой загрузке выбирает DISTINCT усечённых дат по всей таблице
+    list_filter = ['status', 'date']
+    # Общее число строк для пагинатора — с потолком (CappedCountPaginator),
+    # а второй COUNT(*) без фильтров ("из N") не выполняется вовсе
+    paginator = CappedCountPaginator
+    show_full_result_count = False
+    actions = ['approve_selected', 'reject_selected']
+
+    @admin.action(description='Одобрить выбранные записи')
+    def approve_selected(self, request, queryset):
+        count = change_status(queryset.values('pk'), 'approved')
+        self.message_user(request, f'Одобрено записей: {count}.', messages.SUCCESS)
+
+    @admin.action(description='Отклонить выбранные записи')
+    def reject_selected(self, request, queryset):
+        count = change_status(queryset.values('pk'), 'rejected')
+        self.message_user(request, f'Отклонено записей: {count}.', messages.WARNING)
@@ -0,0 +1,315 @@
+import json
+from collections import defaultdict
+from functools import wraps
+
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_http_methods
+
+from .approval import change_status
+from .choices import employee_tasks, invalidate_choices
+from .forms import ProjectRowForm, TaskRowForm, TimesheetFilterForm, TimesheetRowForm
+from .models import Employee, Project, Task, Timesheet
+from .pagination import cursor_state, paginate_by_pk
+from .roles import is_manager
+from .signals import notify_timesheets_changed
+
+# JSON API для внешних систем (зарплата, BI).
+# Строки отдаются прямо из values(), без создания моделей. ?fields=a,b,c выбирает
+# колонки: в SELECT попадают только они, JOIN — только для запрошенных связанных полей.
+# Запись — пачками (JSON-массив), одним bulk_create/bulk_update; при ошибке
+# в любом объекте не сохраняется ничего.
+
+# Имя поля в API → путь в ORM
+TIMESHEET_FIELDS = {
+    'id': 'id',
+    'employee': 'employee_id',
+    'employee_username': 'employee__user__username',
+    'task': 'task_id',
+    'task_name': 'task__name',
+    'project': 'task__project_id',
+    'project_name': 'task__project__name',
+    'date': 'date',
+    'hours': 'hours',
+    'status': 'status',
+    'notes': 'notes',
+    'rate_at_approval': 'rate_at_approval',
+    'salary_amount': 'salary_amount',
+    'created_at': 'created_at',
+}
+TASK_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'project': 'project_id',
+    'project_name': 'project__name',
+    'description': 'description',
+}
+PROJECT_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'description': 'description',
+}
+EMPLOYEE_FIELDS = {
+    'id': 'id',
+    'username': 'user__username',
+    'first_name': 'user__first_name',
+    'last_name': 'user__last_name',
+    'hourly_rate': 'hourly_rate',
+}
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400, errors=None):
+        super().__init__(message)
+        self.status = status
+        self.errors = errors
+
+
+def api_view(*methods):
+    """Только для вошедших пользователей; ApiError и 404 превращаются в JSON-ответ."""
+    def decorator(view):
+        @require_http_methods(methods)
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return JsonResponse({'error': 'Требуется вход.'}, status=401)
+            try:
+                return view(request, *args, **kwargs)
+            except ApiError as exc:
+                body = {'error': str(exc)}
+                if exc.errors:
+                    body['errors'] = exc.errors
+                return JsonResponse(body, status=exc.status)
+            except Http404 as exc:
+                return JsonResponse({'error': str(exc)}, status=404)
+        return wrapper
+    return decorator
+
+
+def _employee_id(user):
+    return Employee.objects.filter(user=user).values_list('pk', flat=True).first()
+
+
+def _require_manager(request):
+    if not is_manager(request.user):
+        raise ApiError('Доступно только менеджеру.', status=403)
+
+
+# --- Чтение ---
+
+def _selected_fields(request, field_map):
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(field_map)
+    names = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in names if name not in field_map]
+    if unknown or not names:
+        raise ApiError(f'Неизвестные поля: {", ".join(unknown)}. Доступны: {", ".join(field_map)}.')
+    return names
+
+
+def _list_response(request, queryset, field_map, state=None):
+    names = _selected_fields(request, field_map)
+    paths = {field_map[name] for name in names} | {'id'}  # id нужен курсору
+    extra_params = {'fields': request.GET['fields']} if request.GET.get('fields') else None
+    page = paginate_by_pk(queryset.values(*paths), request.GET, extra_params=extra_params, state=state)
+    return JsonResponse({
+        'results': [{name: row[field_map[name]] for name in names} for row in page.object_list],
+        'next': request.path + page.next_query if page.has_next else None,
+    })
+
+
+# --- Запись ---
+
+def _items(request):
+    try:
+        items = json.loads(request.body)
+    except ValueError:
+        raise ApiError('Тело запроса — не JSON.')
+    if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+        raise ApiError('Ожидается непустой JSON-массив объектов.')
+    limit = getattr(settings, 'API_MAX_BATCH', 500)
+    if len(items) > limit:
+        raise ApiError(f'Не больше {limit} объектов за запрос.', status=413)
+    return items
+
+
+def _form_errors(form):
+    return {field: [error['message'] for error in errors] for field, errors in form.errors.get_json_data().items()}
+
+
+def _validate(items, form_class, check):
+    """
+    Проверить пачку формой form_class и функцией check(cleaned_data) -> ошибки или None.
+    Ошибки собираются по всем объектам сразу (ключ — номер объекта в массиве).
+    """
+    rows, errors = [], {}
+    for index, item in enumerate(items):
+        form = form_class(item)
+        if not form.is_valid():
+            errors[index] = _form_errors(form)
+        elif problem := check(form.cleaned_data):
+            errors[index] = problem
+        else:
+            rows.append(form.cleaned_data)
+    if errors:
+        raise ApiError('Ошибки в данных, ничего не сохранено.', errors=errors)
+    return rows
+
+
+def _check_task(allowed_task_ids):
+    def check(row):
+        if row['task'] not in allowed_task_ids:
+            return {'task': ['Задача не из проектов сотрудника.']}
+    return check
+
+
+def _create_timesheets(request):
+    items = _items(request)
+    employee_id = _employee_id(request.user)
+    if employee_id is None:
+        raise ApiError('У пользователя нет профиля сотрудника.', status=403)
+    allowed = set(employee_tasks(employee_id).values_list('pk', flat=True))
+    rows = _validate(items, TimesheetRowForm, _check_task(allowed))
+
+    with transaction.atomic():
+        created = Timesheet.objects.bulk_create([
+            Timesheet(employee_id=employee_id, task_id=row['task'], date=row['date'], hours=row['hours'], notes=row['notes'])
+            for row in rows
+        ])
+        # bulk_create обходит post_save — итоги и журнал обновляем одной пачкой
+        notify_timesheets_changed([(None, entry.snapshot()) for entry in created])
+    return JsonResponse({'created': [entry.pk for entry in created]}, status=201)
+
+
+def _update_timesheets(request):
+    """
+    Пачка изменений [{id, ...поля}]: сотрудник правит свои ожидающие записи
+    (task, date, hours, notes), менеджер меняет статус ({id, status}).
+    """
+    items = _items(request)
+    manager = is_manager(request.user)
+    errors = {}
+    status_ids = defaultdict(list)
+    edits = {}
+    for index, item in enumerate(items):
+        pk = item.get('id')
+        if not isinstance(pk, int):
+            errors[index] = {'id': ['Нужен id записи.']}
+            continue
+        if 'status' in item:
+            if not manager:
+                errors[index] = {'status': ['Статус меняет только менеджер.']}
+                continue
+            if item['status'] not in ('approved', 'rejected'):
+                errors[index] = {'status': ['Допустимо approved или rejected.']}
+                continue
+            status_ids[item['status']].append(pk)
+        changes = {key: value for key, value in item.items() if key not in ('id', 'status')}
+        if changes:
+            edits[index] = pk, changes
+
+    with transaction.atomic():
+        changed = []
+        if edits:
+            entries = Timesheet.objects.select_for_update().filter(
+                employee__user=request.user, status='pending',
+            ).in_bulk([pk for pk, _ in edits.values()])
+            allowed = set(employee_tasks(_employee_id(request.user)).values_list('pk', flat=True))
+            check = _check_task(allowed)
+            for index, (pk, changes) in edits.items():
+                entry = entries.get(pk)
+                if entry is None:
+                    errors[index] = {'id': ['Нет такой ожидающей записи у сотрудника.']}
+                    continue
+                current = {'task': entry.task_id, 'date': entry.date, 'hours': entry.hours, 'notes': entry.notes}
+                form = TimesheetRowForm({**current, **changes})
+                if not form.is_valid():
+                    errors[index] = _form_errors(form)
+                elif problem := check(form.cleaned_data):
+                    errors[index] = problem
+                else:
+                    old = entry.snapshot()
+                    row = form.cleaned_data
+                    entry.task_id, entry.date, entry.hours, entry.notes = row['task'], row['date'], row['hours'], row['notes']
+                    changed.append((old, entry))
+        if errors:
+            raise ApiError('Ошибки в данных, ничего не сохранено.', errors=errors)
+
+        if changed:
+            Timesheet.objects.bulk_update([entry for _, entry in changed], ['task', 'date', 'hours', 'notes'])
+            notify_timesheets_changed([(old, entry.snapshot()) for old, entry in changed])
+        result = {'updated': len(changed)}
+        for status, ids in status_ids.items():
+            result[status] = change_status(ids, status)
+    return JsonResponse(result)
+
+
+# --- Ресурсы ---
+
+@api_view('GET', 'POST', 'PATCH')
+def timesheets_api(request):
+    if request.method == 'POST':
+        return _create_timesheets(request)
+    if request.method == 'PATCH':
+        return _update_timesheets(request)
+
+    # Те же фильтры, что у HTML-списка; на следующих страницах — из курсора
+    data = cursor_state(request.GET)
+    if data is None:
+        data = request.GET
+    queryset = Timesheet.objects.all()
+    if is_manager(request.user):
+        form = TimesheetFilterForm(data)
+    else:
+        queryset = queryset.filter(employee__user=request.user)
+        form = TimesheetFilterForm(data, employee_id=_employee_id(request.user) or 0)
+    return _list_response(request, form.filter(queryset), TIMESHEET_FIELDS, state=form.state())
+
+
+@api_view('GET', 'POST')
+def tasks_api(request):
+    if request.method == 'POST':
+        _require_manager(request)
+        items = _items(request)
+        project_ids = {item.get('project') for item in items if isinstance(item.get('project'), int)}
+        existing = set(Project.objects.filter(pk__in=project_ids).values_list('pk', flat=True))
+        rows = _validate(items, TaskRowForm, lambda row: None if row['project'] in existing else {'project': ['Нет такого проекта.']})
+        created = Task.objects.bulk_create([
+            Task(name=row['name'], project_id=row['project'], description=row['description']) for row in rows
+        ])
+        invalidate_choices()  # bulk_create обходит post_save
+        return JsonResponse({'created': [task.pk for task in created]}, status=201)
+
+    if is_manager(request.user):
+        queryset = Task.objects.all()
+    else:
+        queryset = employee_tasks(_employee_id(request.user) or 0)
+    return _list_response(request, queryset, TASK_FIELDS)
+
+
+@api_view('GET', 'POST')
+def projects_api(request):
+    if request.method == 'POST':
+        _require_manager(request)
+        rows = _validate(_items(request), ProjectRowForm, lambda row: None)
+        created = Project.objects.bulk_create([
+            Project(name=row['name'], description=row['description']) for row in rows
+        ])
+        invalidate_choices()
+        return JsonResponse({'created': [project.pk for project in created]}, status=201)
+
+    queryset = Project.objects.all()
+    if not is_manager(request.user):
+        queryset = queryset.filter(employees=_employee_id(request.user) or 0)
+    return _list_response(request, queryset, PROJECT_FIELDS)
+
+
+# Сотрудники привязаны к учётным записям — через API только чтение
+@api_view('GET')
+def employees_api(request):
+    queryset = Employee.objects.all()
+    if not is_manager(request.user):
+        queryset = queryset.filter(user=request.user)
+    return _list_response(request, queryset, EMPLOYEE_FIELDS)
@@ -0,0 +1,71 @@
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef
+from django.db.models.functions import Round
+
+from . import versions
+from .models import Timesheet
+from .rates import effective_rate
+from .signals import notify_timesheets_changed
+
+
+def salary_snapshot(status):
+    """
+    Значения rate_at_approval/salary_amount для UPDATE записей, переводимых в status
+    (SQL-аналог Timesheet.snapshot_salary): ставка на дату записи — коррелированным подзапросом.
+    """
+    if status != 'approved':
+        return {'rate_at_approval': None, 'salary_amount': None}
+    rate = effective_rate(OuterRef('employee_id'), OuterRef('date'))
+    amount = ExpressionWrapper(F('hours') * rate, output_field=DecimalField(max_digits=12, decimal_places=2))
+    return {'rate_at_approval': rate, 'salary_amount': Round(amount, 2)}
+
+
+def change_status(timesheet_ids, new_status, from_status='pending'):
+    """
+    Массово сменить статус записей одним UPDATE ... WHERE status = from_status.
+    timesheet_ids — список id или queryset (например, из действия админки).
+    Производные данные (итоги, недельный журнал, уведомления о переработке)
+    обновляются одной пачкой — по сотруднику и по сотрудник-неделе, а не по строке.
+    Возвращает число изменённых записей.
+    """
+    with transaction.atomic():
+        rows = list(
+            Timesheet.objects.select_for_update()
+            .filter(pk__in=timesheet_ids, status=from_status)
+            .values('pk', *Timesheet.SNAPSHOT_FIELDS)
+        )
+        if not rows:
+            return 0
+
+        # Тот же фильтр, что и у выборки: строки уже заблокированы, а список id
+        # не раздувает запрос (timesheet_ids может быть и queryset'ом — подзапрос)
+        Timesheet.objects.filter(pk__in=timesheet_ids, status=from_status).update(
+            status=new_status, **salary_snapshot(new_status),
+        )
+        for row in rows:
+            del row['pk']
+        notify_timesheets_changed([(row, {**row, 'status': new_status}) for row in rows])
+    return len(rows)
+
+
+def backfill_salary(batch_size=1000, recompute=False):
+    """
+    Заполнить rate_at_approval/salary_amount у одобренных записей, где их ещё нет
+    (данные до появления снимка, bulk_create), а с recompute — пересчитать у всех
+    одобренных по истории ставок. Порциями по id, каждая — в своей транзакции,
+    чтобы не держать блокировку на всю таблицу. Возвращает число записей.
+    """
+    pending = Timesheet.objects.filter(status='approved').order_by('pk')
+    if not recompute:
+        pending = pending.filter(salary_amount__isnull=True)
+    total = 0
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            rows = list(pending.filter(pk__gt=last_pk).values_list('pk', 'employee_id', 'date')[:batch_size])
+            if not rows:
+                return total
+            total += Timesheet.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(**salary_snapshot('approved'))
+            # Суммы в отчётах этих месяцев изменились
+            versions.bump((employee_id, day) for _, employee_id, day in rows)
+        last_pk = rows[-1][0]
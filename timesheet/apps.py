@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TimesheetConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'timesheet'
+
+    def ready(self):
+        from . import signals, tasks  # noqa: F401 — подключает сигналы и обработчики фоновых задач
@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Employee, Project, Task
+
+# Выпадающие списки (задачи в форме записи, фильтры списка) кешируются.
+# Любое изменение задач, проектов, их состава или сотрудников увеличивает общую
+# версию (signals.py) — старые ключи просто перестают читаться и истекают сами
+TASK_CHOICES_TIMEOUT = 60 * 60
+_VERSION_KEY = 'timesheet:task_choices:version'
+
+
+def _version():
+    return cache.get_or_set(_VERSION_KEY, 1, None)
+
+
+def choices_version():
+    # Меняется при переименовании задач, проектов и сотрудников — для ETag страниц
+    return _version()
+
+
+def _cached(name, build):
+    key = f'timesheet:{name}:{_version()}'
+    choices = cache.get(key)
+    if choices is None:
+        choices = build()
+        cache.set(key, choices, TASK_CHOICES_TIMEOUT)
+    return choices
+
+
+def invalidate_choices():
+    try:
+        cache.incr(_VERSION_KEY)
+    except ValueError:
+        cache.set(_VERSION_KEY, 1, None)
+
+
+def task_label(name, project_name):
+    # Как Task.__str__, но без обращения к self.project
+    return f"{name} ({project_name})"
+
+
+def employee_tasks(employee_id):
+    """Задачи проектов, в которых состоит сотрудник."""
+    return Task.objects.filter(project__employees=employee_id).select_related('project')
+
+
+def task_choices(employee_id):
+    """[(id, подпись)] задач сотрудника: один запрос при промахе кеша, ни одного при попадании."""
+    if employee_id is None:
+        return []
+    return _cached(f'task_choices:{employee_id}', lambda: _task_rows(employee_tasks(employee_id)))
+
+
+def _task_rows(tasks):
+    rows = tasks.order_by('project__name', 'name').values_list('pk', 'name', 'project__name')
+    return [(pk, task_label(name, project_name)) for pk, name, project_name in rows]
+
+
+def project_task_choices(project_id):
+    """[(id, подпись)] задач одного проекта — для фильтра менеджера."""
+    return _cached(
+        f'project_task_choices:{project_id}',
+        lambda: _task_rows(Task.objects.filter(project=project_id)),
+    )
+
+
+def project_choices(employee_id=None):
+    """[(id, название)] проектов сотрудника; без employee_id — все проекты."""
+    def build():
+        projects = Project.objects.all()
+        if employee_id is not None:
+            projects = projects.filter(employees=employee_id)
+        return list(projects.order_by('name').values_list('pk', 'name'))
+    return _cached(f'project_choices:{"all" if employee_id is None else employee_id}', build)
+
+
+def employee_choices():
+    """[(id, имя)] всех сотрудников — для фильтра менеджера."""
+    def build():
+        rows = Employee.objects.order_by('user__username').values_list(
+            'pk', 'user__first_name', 'user__last_name', 'user__username',
+        )
+        return [(pk, f"{first} {last}".strip() or username) for pk, first, last, username in rows]
+    return _cached('employee_choices', build)
+
+
+def choices_limit():
+    # Больше задач — вместо выпадающего списка поиск через автодополнение
+    return getattr(settings, 'TASK_CHOICES_LIMIT', 200)
@@ -0,0 +1,50 @@
+import hashlib
+from calendar import timegm
+from functools import wraps
+
+from django.contrib.messages import get_messages
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+# Условный GET по "водяным знакам" данных (versions.watermark): если клиент
+# прислал If-None-Match / If-Modified-Since, а данные не менялись, отвечаем 304,
+# не выполняя ни запросов view, ни рендеринга, ни сборки Excel.
+
+def _has_messages(request):
+    # Ожидающие flash-сообщения нужно показать — такую страницу не кешируем
+    return len(get_messages(request)) > 0
+
+
+def conditional(state_func):
+    """
+    state_func(request, *args, **kwargs) -> (части ETag, datetime последнего изменения)
+    или None, если проверка не применяется. ETag учитывает пользователя и CSRF-куку:
+    сохранённая у клиента страница должна быть именно его.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or _has_messages(request):
+                return view(request, *args, **kwargs)
+            state = state_func(request, *args, **kwargs)
+            if state is None:
+                return view(request, *args, **kwargs)
+
+            parts, last_modified = state
+            key = repr((request.user.pk, request.META.get('CSRF_COOKIE'), *parts))
+            etag = quote_etag(hashlib.sha1(key.encode()).hexdigest())
+            timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200:
+                    response.headers['ETag'] = etag
+                    if timestamp is not None:
+                        response.headers['Last-Modified'] = http_date(timestamp)
+            # Страница личная и должна перепроверяться при каждом обращении
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,12 @@
+from .roles import get_roles, is_manager
+
+
+def roles(request):
+    # Роли вычисляются лениво и один раз на запрос (см. roles.get_roles)
+    user = getattr(request, 'user', None)
+    if user is None:
+        return {}
+    return {
+        'roles': get_roles(user),
+        'is_manager': is_manager(user),
+    }
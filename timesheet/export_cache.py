@@ -0,0 +1,109 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from . import versions
+
+# Дисковый кеш готовых книг Excel за закрытые месяцы. Имя файла — хеш содержимого
+# выгрузки (content-addressed): отпечаток месяца меняется при любом изменении
+# строк, сумм или подписей, и прежний файл просто перестаёт запрашиваться.
+# Повторная выгрузка отдаётся прямо из файла (FileResponse — через sendfile,
+# если сервер его поддерживает). Старые файлы вытесняются по давности
+# последнего обращения (LRU), чтобы кеш не превышал EXPORT_CACHE_MAX_BYTES.
+
+EXPORT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+def cache_root():
+    return Path(getattr(settings, 'EXPORT_CACHE_ROOT', settings.BASE_DIR / 'exports' / 'cache'))
+
+
+def is_closed(month):
+    return month < timezone.localdate().replace(day=1)
+
+
+def month_fingerprint(timesheets, month):
+    """
+    Отпечаток выгрузки месяца одним GROUP BY по подписям (сотрудник, проект, задача):
+    число строк, сумма и максимум id, суммы часов, ставок и зарплаты в каждой
+    группе, плюс версия месяца (versions) — маркер последнего изменения.
+    """
+    groups = timesheets.values_list(
+        'employee__user__first_name',
+        'employee__user__last_name',
+        'employee__user__username',
+        'task__project__name',
+        'task__name',
+    ).annotate(
+        Count('id'), Sum('id'), Max('id'), Sum('hours'), Sum('rate_at_approval'), Sum('salary_amount'),
+    ).order_by(
+        'employee__user__username', 'employee__user__first_name', 'employee__user__last_name',
+        'task__project__name', 'task__name',
+    )
+
+    digest = hashlib.sha256()
+    digest.update(f'{month:%Y-%m}:{versions.watermark(versions.ALL, month)[0]}'.encode())
+    for group in groups:
+        digest.update(repr(group).encode())
+    return digest.hexdigest()
+
+
+def cached_workbook(key, build):
+    """
+    Открытая на чтение книга с ключом key: из кеша или собранная build(fileobj).
+    Попадание обновляет время обращения файла — по нему работает вытеснение.
+    Файл открывается сразу: вытеснение параллельным запросом его уже не отнимет.
+    """
+    root = cache_root()
+    path = root / f'{key}.xlsx'
+    try:
+        output = path.open('rb')
+    except FileNotFoundError:
+        pass
+    else:
+        os.utime(output.fileno())
+        return output
+
+    root.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=root, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            build(output)
+        # Параллельная сборка того же ключа даст тот же файл — замена безопасна
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+    output = path.open('rb')
+    evict(keep=path)
+    return output
+
+
+def evict(keep=None, max_bytes=None):
+    """Удалить самые давно запрошенные книги, пока кеш больше бюджета. Возвращает число удалённых."""
+    if max_bytes is None:
+        max_bytes = getattr(settings, 'EXPORT_CACHE_MAX_BYTES', EXPORT_CACHE_MAX_BYTES)
+    files = []
+    for path in cache_root().glob('*.xlsx'):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for _, size, path in sorted(files, key=lambda item: item[0]):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        path.unlink(missing_ok=True)
+        total -= size
+        removed += 1
+    return removed
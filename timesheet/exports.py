@@ -0,0 +1,326 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+from . import versions
+from .jobs import enqueue, heartbeat
+from .models import ExportJob, Timesheet
+
+# Выгрузка одобренных записей: синхронно (export_timesheets_excel)
+# или в фоне (ExportJob). Строки идут по одному конвейеру генераторов:
+# выборка values_list (export_rows) → подписи (format_rows) → итоги (Totals),
+# а на выходе — сменный писатель формата (WRITERS: xlsx, csv, jsonl).
+# В памяти держится только текущая порция строк.
+# Фоновая выгрузка пишет файл в EXPORT_ROOT и отмечает прогресс; файл с теми же
+# параметрами при той же версии данных (versions.watermark) собирается один раз.
+
+EXPORT_CHUNK_SIZE = 2000
+# Как часто (в строках) воркер сохраняет прогресс
+EXPORT_PROGRESS_STEP = 5000
+# Сколько хранится готовый файл, сек. Версии месяцев не учитывают переименование
+# сотрудников и проектов — срок ограничивает, как долго такой файл может отдаваться
+EXPORT_FILE_TTL = 24 * 60 * 60
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+HEADERS = ['Сотрудник', 'Проект', 'Задача', 'Дата', 'Часы', 'Ставка', 'Зарплата']
+
+# employee_id — только для группировки (одноимённые сотрудники), в файл не пишется
+ExportRow = namedtuple('ExportRow', 'employee project task date hours rate salary employee_id')
+
+
+def export_queryset(month=None):
+    """Одобренные записи месяца (первое число) или всей истории."""
+    timesheets = Timesheet.objects.filter(status='approved')
+    if month is not None:
+        timesheets = timesheets.filter(date__gte=month, date__lt=_next_month(month))
+    return timesheets
+
+
+def _next_month(month):
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def export_filename(month=None, today=None, extension='xlsx'):
+    if month is not None:
+        return f"timesheet_{month:%Y-%m}.{extension}"
+    return f"timesheet_full_{(today or timezone.localdate()):%Y%m%d}.{extension}"
+
+
+# --- Конвейер строк ---
+
+def export_rows(timesheets, ordering=('date', 'id')):
+    # Только нужные колонки, без создания моделей; строки читаются из БД порциями
+    return timesheets.order_by(*ordering).values_list(
+        'employee_id',
+        'employee__user__first_name',
+        'employee__user__last_name',
+        'employee__user__username',
+        'task__project__name',
+        'task__name',
+        'date',
+        'hours',
+        'rate_at_approval',
+        'salary_amount',
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def format_rows(rows):
+    """Строки export_rows → ExportRow с именем сотрудника вместо трёх полей."""
+    for employee_id, first_name, last_name, username, project_name, task_name, day, hours, rate, salary in rows:
+        # Запись без снимка ставки (NULL) не должна ронять выгрузку
+        if rate is None:
+            rate = Decimal(0)
+        if salary is None:
+            salary = (hours * rate).quantize(Decimal('0.01'))
+        yield ExportRow(
+            f"{first_name} {last_name}".strip() or username,
+            project_name, task_name, day, hours, rate, salary, employee_id,
+        )
+
+
+class Totals:
+    """Итоги по прошедшим через track() строкам; progress(n) — каждые step строк."""
+
+    def __init__(self, progress=None, step=EXPORT_PROGRESS_STEP):
+        self.rows = 0
+        self.hours = Decimal(0)
+        self.salary = Decimal(0)
+        self.progress = progress
+        self.step = step
+
+    def track(self, rows):
+        for row in rows:
+            self.rows += 1
+            self.hours += row.hours
+            self.salary += row.salary
+            if self.progress is not None and self.rows % self.step == 0:
+                self.progress(self.rows)
+            yield row
+        if self.progress is not None:
+            self.progress(self.rows)
+
+
+def export_pipeline(timesheets, ordering=('date', 'id'), progress=None):
+    """(генератор ExportRow, Totals) — итоги заполнены, когда генератор исчерпан."""
+    totals = Totals(progress)
+    return totals.track(format_rows(export_rows(timesheets, ordering))), totals
+
+
+# --- Писатели форматов ---
+
+class ExportWriter(ABC):
+    """Формат выгрузки: write() пишет строки и итоги в открытый двоичный файл."""
+    extension = None
+    content_type = None
+
+    @abstractmethod
+    def write(self, rows, totals, output):
+        ...
+
+
+class StreamingExportWriter(ExportWriter):
+    """
+    Потоковый формат: chunks() отдаёт байты порциями — прямо в ответ,
+    без промежуточного файла; write() собирает файл из тех же порций.
+    """
+    # Строк в одной порции chunks()
+    batch_size = 1000
+
+    @abstractmethod
+    def chunks(self, rows, totals):
+        ...
+
+    def write(self, rows, totals, output):
+        for chunk in self.chunks(rows, totals):
+            output.write(chunk)
+
+
+class CsvWriter(StreamingExportWriter):
+    # UTF-8 с BOM — чтобы Excel открыл кириллицу; даты ISO, суммы без округления
+    extension = 'csv'
+    content_type = 'text/csv; charset=utf-8'
+
+    def chunks(self, rows, totals):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        buffer.write('\ufeff')
+        writer.writerow(HEADERS)
+        for batch in _batches(rows, self.batch_size):
+            writer.writerows(row[:len(HEADERS)] for row in batch)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+
+
+class JsonLinesWriter(StreamingExportWriter):
+    # Один JSON-объект на строку — для загрузки в другие системы.
+    # Часы и деньги — десятичными строками: float исказил бы копейки
+    extension = 'jsonl'
+    content_type = 'application/x-ndjson'
+
+    def chunks(self, rows, totals):
+        for batch in _batches(rows, self.batch_size):
+            yield ''.join(
+                json.dumps({
+                    'employee': row.employee,
+                    'project': row.project,
+                    'task': row.task,
+                    'date': row.date.isoformat(),
+                    'hours': str(row.hours),
+                    'rate': str(row.rate),
+                    'salary': str(row.salary),
+                }, ensure_ascii=False) + '\n'
+                for row in batch
+            ).encode()
+
+
+class XlsxWriter(ExportWriter):
+    # write-only режим openpyxl: строки сразу сбрасываются во временный файл,
+    # в памяти держится только текущая строка. Книга собирается целиком, поэтому не потоковая
+    extension = 'xlsx'
+    content_type = XLSX_CONTENT_TYPE
+
+    def write(self, rows, totals, output):
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Таймшит")
+        ws.append([_bold_cell(ws, header) for header in HEADERS])
+        for row in rows:
+            ws.append([
+                row.employee,
+                row.project,
+                row.task,
+                row.date.strftime("%d.%m.%Y"),
+                float(row.hours),
+                float(row.rate),
+                float(row.salary),
+            ])
+        ws.append([])
+        ws.append(['ИТОГО ЗАРПЛАТА:', '', '', '', '', '', totals.salary])
+        wb.save(output)
+
+
+WRITERS = {writer.extension: writer for writer in (XlsxWriter, CsvWriter, JsonLinesWriter)}
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _bold_cell(ws, value):
+    cell = WriteOnlyCell(ws, value=value)
+    cell.font = Font(bold=True)
+    return cell
+
+
+def write_export(timesheets, output, writer_class=XlsxWriter, progress=None):
+    """Записать выгрузку в файл output. Возвращает Totals."""
+    rows, totals = export_pipeline(timesheets, progress=progress)
+    writer_class().write(rows, totals, output)
+    return totals
+
+
+# --- Фоновая выгрузка ---
+
+def export_root():
+    return Path(getattr(settings, 'EXPORT_ROOT', settings.BASE_DIR / 'exports'))
+
+
+def _fresh_since():
+    return timezone.now() - timedelta(seconds=getattr(settings, 'EXPORT_FILE_TTL', EXPORT_FILE_TTL))
+
+
+def request_export(user, month=None):
+    """
+    Найти выгрузку с теми же параметрами и версией данных (ожидающую, идущую
+    или готовую с файлом на диске) или поставить новую в очередь.
+    Возвращает (ExportJob, создана ли новая).
+    """
+    version, _ = versions.watermark(versions.ALL, month)
+    existing = (
+        ExportJob.objects
+        .filter(month=month, data_version=version, created_at__gte=_fresh_since())
+        .exclude(status='failed')
+        .exclude(job__status='failed')
+        .order_by('-id')
+        .first()
+    )
+    if existing is not None and (existing.status != 'done' or existing.path.exists()):
+        return existing, False
+
+    with transaction.atomic():
+        export = ExportJob.objects.create(requested_by=user, month=month, data_version=version)
+        export.job = enqueue('export_excel', export_id=export.pk)
+        export.save(update_fields=['job'])
+    return export, True
+
+
+def purge_expired():
+    """Удалить просроченные завершённые выгрузки вместе с файлами."""
+    expired = ExportJob.objects.filter(created_at__lt=_fresh_since(), status__in=('done', 'failed'))
+    for export in expired.exclude(file_name=''):
+        export.path.unlink(missing_ok=True)
+    return expired.delete()[0]
+
+
+def _progress(export_id, rows_done):
+    ExportJob.objects.filter(pk=export_id).update(rows_done=rows_done)
+    # Долгая сборка продлевает аренду задачи, чтобы её не сочли брошенной
+    heartbeat()
+
+
+def run_export(export_id):
+    """Собрать файл выгрузки (вызывается воркером, вне транзакции — прогресс виден сразу)."""
+    export = ExportJob.objects.get(pk=export_id)
+    # Версия на момент чтения: файл отражает именно её
+    version, _ = versions.watermark(versions.ALL, export.month)
+    timesheets = export_queryset(export.month)
+    ExportJob.objects.filter(pk=export.pk).update(
+        status='running', data_version=version, rows_done=0, rows_total=timesheets.count(), error='',
+    )
+
+    root = export_root()
+    root.mkdir(parents=True, exist_ok=True)
+    file_name = f"export_{export.pk}.xlsx"
+    fd, tmp_path = tempfile.mkstemp(dir=root, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            write_export(
+                timesheets, output,
+                progress=lambda n: _progress(export.pk, n),
+            )
+        # Файл появляется под своим именем только целиком
+        os.replace(tmp_path, root / file_name)
+    except Exception as exc:
+        Path(tmp_path).unlink(missing_ok=True)
+        ExportJob.objects.filter(pk=export.pk).update(status='failed', error=str(exc))
+        raise
+
+    # Данные изменились во время сборки — файл отдаём, но повторно не используем
+    if versions.watermark(versions.ALL, export.month)[0] != version:
+        version = None
+    ExportJob.objects.filter(pk=export.pk).update(
+        status='done', file_name=file_name, data_version=version, finished_at=timezone.now(),
+    )
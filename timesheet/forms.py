@@ -1,5 +1,15 @@
 from django import forms
-from .models import Timesheet
+from django.db.models import Q
+from django.urls import reverse
+
+from .choices import (
+    choices_limit, employee_choices, project_choices, project_task_choices, task_choices, task_label,
+)
+from .models import Task, Timesheet
+
+# Не больше стольких часов в день по всем задачам недельной сетки
+MAX_HOURS_PER_DAY = 24
+DAY_NAMES = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
 
 class TimesheetForm(forms.ModelForm):
     class Meta:
@@ -8,4 +18,151 @@ class TimesheetForm(forms.ModelForm):
         widgets = {
             'date': forms.DateInput(attrs={'type': 'date'}),
             'hours': forms.NumberInput(attrs={'step': '0.5', 'min': '0'}),
-        }
\ No newline at end of file
+        }
+
+    def __init__(self, *args, employee_id=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Только задачи проектов сотрудника (и текущая задача записи, если её уже нет в них)
+        current_task_id = self.instance.task_id if self.instance.pk else None
+        scope = Q(project__employees=employee_id) if employee_id else Q(pk__in=[])
+        if current_task_id:
+            scope |= Q(pk=current_task_id)
+        field = self.fields['task']
+        field.queryset = Task.objects.filter(scope).select_related('project').distinct()
+
+        choices = task_choices(employee_id)
+        if current_task_id and all(pk != current_task_id for pk, _ in choices):
+            task = Task.objects.select_related('project').get(pk=current_task_id)
+            choices = [(task.pk, task_label(task.name, task.project.name))] + choices
+
+        if len(choices) > choices_limit():
+            # Слишком много задач для <select>: рендерим только выбранную,
+            # остальные подгружает поиск (task_autocomplete)
+            selected = str(self['task'].value() or '')
+            choices = [choice for choice in choices if str(choice[0]) == selected]
+            field.widget.attrs['data-autocomplete-url'] = reverse('task_autocomplete')
+        field.choices = [('', '---------')] + choices
+
+
+class WeekRowForm(forms.Form):
+    # Строка недельной сетки: задача и часы по дням (пн … вс)
+    task = forms.IntegerField(widget=forms.HiddenInput)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for day in range(7):
+            self.fields[f'day_{day}'] = forms.DecimalField(
+                required=False, min_value=0, max_digits=5, decimal_places=2,
+                widget=forms.NumberInput(attrs={'step': '0.5', 'min': '0', 'class': 'form-control form-control-sm text-center'}),
+            )
+
+    def day_values(self):
+        return [self.cleaned_data.get(f'day_{day}') for day in range(7)]
+
+
+class BaseWeekGridFormSet(forms.BaseFormSet):
+    def clean(self):
+        # Проверяем сетку целиком: сумма часов за каждый день по всем задачам
+        if any(self.errors):
+            return
+        totals = [0] * 7
+        for form in self.forms:
+            for day, value in enumerate(form.day_values()):
+                totals[day] += value or 0
+        overloaded = [day for day, total in enumerate(totals) if total > MAX_HOURS_PER_DAY]
+        if overloaded:
+            raise forms.ValidationError(
+                f'В день нельзя записать больше {MAX_HOURS_PER_DAY} ч — проверьте: '
+                + ', '.join(DAY_NAMES[day] for day in overloaded)
+            )
+
+
+WeekGridFormSet = forms.formset_factory(WeekRowForm, formset=BaseWeekGridFormSet, extra=0)
+
+
+class TimesheetRowForm(forms.Form):
+    # Одна запись из пачки (JSON API, импорт): только проверка значений,
+    # без запросов к БД — допустимость задачи проверяет вызывающий по заранее
+    # загруженному набору id
+    task = forms.IntegerField()
+    date = forms.DateField()
+    hours = forms.DecimalField(min_value=0, max_value=MAX_HOURS_PER_DAY, max_digits=5, decimal_places=2)
+    notes = forms.CharField(required=False)
+
+
+class TimesheetImportForm(forms.Form):
+    file = forms.FileField(label='Файл CSV или XLSX')
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        if not upload.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError('Поддерживаются файлы .csv и .xlsx.')
+        return upload
+
+
+class TaskRowForm(forms.Form):
+    name = forms.CharField(max_length=100)
+    project = forms.IntegerField()
+    description = forms.CharField(required=False)
+
+
+class ProjectRowForm(forms.Form):
+    name = forms.CharField(max_length=100)
+    description = forms.CharField(required=False)
+
+
+class TimesheetFilterForm(forms.Form):
+    # Фильтры списка записей (GET). Каждое сочетание ложится на индекс:
+    # сотрудник — (employee, date), статус — (status, date) или частичный индекс
+    # ожидающих, задача и проект — (task, date)
+    date_from = forms.DateField(required=False, label='С', widget=forms.DateInput(attrs={'type': 'date'}))
+    date_to = forms.DateField(required=False, label='По', widget=forms.DateInput(attrs={'type': 'date'}))
+    employee = forms.TypedChoiceField(required=False, coerce=int, empty_value=None, label='Сотрудник')
+    project = forms.TypedChoiceField(required=False, coerce=int, empty_value=None, label='Проект')
+    task = forms.TypedChoiceField(required=False, coerce=int, empty_value=None, label='Задача')
+    status = forms.ChoiceField(required=False, label='Статус', choices=[('', 'Все статусы')] + Timesheet.STATUS_CHOICES)
+
+    def __init__(self, *args, employee_id=None, **kwargs):
+        # employee_id — сотрудник видит только свои проекты и задачи;
+        # None — менеджер: все сотрудники, задачи выбранного проекта
+        super().__init__(*args, **kwargs)
+        if employee_id is None:
+            self.fields['employee'].choices = [('', 'Все сотрудники')] + employee_choices()
+            self.fields['project'].choices = [('', 'Все проекты')] + project_choices()
+            project_id = str(self['project'].value() or '')
+            tasks = project_task_choices(int(project_id)) if project_id.isdigit() else []
+        else:
+            del self.fields['employee']
+            self.fields['project'].choices = [('', 'Все проекты')] + project_choices(employee_id)
+            tasks = task_choices(employee_id)
+        self.fields['task'].choices = [('', 'Все задачи')] + tasks
+        for field in self.fields.values():
+            select = isinstance(field.widget, forms.Select)
+            field.widget.attrs['class'] = 'form-select form-select-sm' if select else 'form-control form-control-sm'
+
+    def filters(self):
+        """Значения корректно заполненных полей; ошибочные просто не применяются."""
+        self.is_valid()
+        data = getattr(self, 'cleaned_data', {})
+        return {name: value for name, value in data.items() if value not in (None, '')}
+
+    def state(self):
+        # Для курсора пагинации: только строки, как в GET-параметрах
+        return {name: str(value) for name, value in self.filters().items()}
+
+    def filter(self, queryset):
+        values = self.filters()
+        if 'employee' in values:
+            queryset = queryset.filter(employee_id=values['employee'])
+        if 'status' in values:
+            queryset = queryset.filter(status=values['status'])
+        if 'date_from' in values:
+            queryset = queryset.filter(date__gte=values['date_from'])
+        if 'date_to' in values:
+            queryset = queryset.filter(date__lte=values['date_to'])
+        if 'task' in values:
+            queryset = queryset.filter(task_id=values['task'])
+        elif 'project' in values:
+            # IN (задачи проекта) вместо JOIN — так работает индекс (task, date)
+            queryset = queryset.filter(task__in=Task.objects.filter(project=values['project']).values('pk'))
+        return queryset
@@ -0,0 +1,237 @@
+import csv
+import io
+from dataclasses import dataclass
+from datetime import date, datetime
+from itertools import chain
+from zipfile import BadZipFile
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+from . import ledger, stats, versions
+from .approval import backfill_salary
+from .forms import TimesheetRowForm
+from .models import Employee, Task, Timesheet
+
+# Импорт записей из CSV/XLSX (перенос из старых систем).
+# Файл читается потоково, строка за строкой; сотрудники и задачи сопоставляются
+# по словарям, загруженным один раз; записи пишутся пачками bulk_create.
+# В памяти — только словари, текущая пачка и множество затронутых сотрудников,
+# поэтому размер файла не ограничен. Ошибочные строки не прерывают импорт,
+# а передаются в reject(...) — из них собирается отчёт.
+
+IMPORT_BATCH_SIZE = 2000
+
+# Заголовок столбца (без учёта регистра) → поле
+HEADER_ALIASES = {
+    'employee': 'employee', 'username': 'employee', 'сотрудник': 'employee',
+    'project': 'project', 'проект': 'project',
+    'task': 'task', 'задача': 'task',
+    'date': 'date', 'дата': 'date',
+    'hours': 'hours', 'часы': 'hours',
+    'notes': 'notes', 'комментарий': 'notes',
+    'status': 'status', 'статус': 'status',
+}
+REQUIRED_COLUMNS = ('employee', 'project', 'task', 'date', 'hours')
+
+# Статус можно указать кодом или подписью: approved / Одобрено
+STATUS_LOOKUP = {
+    **{code: code for code, _ in Timesheet.STATUS_CHOICES},
+    **{label.lower(): code for code, label in Timesheet.STATUS_CHOICES},
+}
+
+
+class ImportFormatError(ValueError):
+    """Файл нельзя импортировать целиком: неизвестный формат, нет нужных столбцов."""
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    rejected: int = 0
+
+
+# --- Чтение файла ---
+
+def _csv_rows(fileobj, encoding):
+    text = io.TextIOWrapper(fileobj, encoding=encoding, newline='')
+    first = text.readline()
+    try:
+        dialect = csv.Sniffer().sniff(first, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    try:
+        yield from csv.reader(chain([first], text), dialect)
+    except csv.Error as exc:
+        raise ImportFormatError(f'Не удалось разобрать CSV: {exc}.') from exc
+
+
+def _xlsx_rows(fileobj):
+    # read_only: openpyxl разбирает лист потоково, не загружая книгу в память
+    try:
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    except (BadZipFile, InvalidFileException, KeyError) as exc:
+        # Не zip-архив или архив без книги внутри
+        raise ImportFormatError('Файл .xlsx повреждён или не является книгой Excel.') from exc
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def read_rows(fileobj, filename, encoding='utf-8-sig'):
+    """Строки файла: (номер строки, {поле: значение}). Пустые строки пропускаются."""
+    name = filename.lower()
+    if name.endswith('.csv'):
+        rows = _csv_rows(fileobj, encoding)
+    elif name.endswith('.xlsx'):
+        rows = _xlsx_rows(fileobj)
+    else:
+        raise ImportFormatError('Поддерживаются файлы .csv и .xlsx.')
+
+    header = next(rows, None) or ()
+    columns = [HEADER_ALIASES.get(str(title or '').strip().lower()) for title in header]
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ImportFormatError(f'Нет обязательных столбцов: {", ".join(missing)}.')
+
+    for line, values in enumerate(rows, start=2):
+        if not any(value not in (None, '') for value in values):
+            continue
+        yield line, {column: value for column, value in zip(columns, values) if column}
+
+
+# --- Проверка и запись ---
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = _text(value)
+    for parse in (date.fromisoformat, lambda s: datetime.strptime(s, '%d.%m.%Y').date()):
+        try:
+            return parse(text)
+        except ValueError:
+            pass
+    return text  # пусть форма сообщит об ошибке
+
+
+def load_lookups():
+    """Словари сопоставления: логин → id сотрудника, (проект, задача) → id задачи."""
+    employees = dict(Employee.objects.values_list('user__username', 'pk'))
+    tasks = {}
+    for pk, task_name, project_name in Task.objects.values_list('pk', 'name', 'project__name'):
+        key = project_name.lower(), task_name.lower()
+        # Одноимённые задачи в одноимённых проектах не различить — такие строки отклоняются
+        tasks[key] = None if key in tasks else pk
+    return employees, tasks
+
+
+def build_entry(record, employees, tasks):
+    """Timesheet из строки файла или (None, {поле: [ошибки]})."""
+    errors = {}
+    employee_id = employees.get(_text(record.get('employee')))
+    if employee_id is None:
+        errors['employee'] = ['Нет сотрудника с таким логином.']
+
+    key = _text(record.get('project')).lower(), _text(record.get('task')).lower()
+    task_id = tasks.get(key)
+    if task_id is None:
+        errors['task'] = ['Задача неоднозначна.' if key in tasks else 'Нет такой задачи в проекте.']
+
+    status = STATUS_LOOKUP.get(_text(record.get('status')).lower() or 'pending')
+    if status is None:
+        errors['status'] = ['Неизвестный статус.']
+
+    row = {}
+    values = {
+        'task': task_id or 0,
+        'date': _parse_date(record.get('date')),
+        'hours': _text(record.get('hours')).replace(',', '.'),
+        'notes': _text(record.get('notes')),
+    }
+    # Поля TimesheetRowForm без создания формы на каждую строку:
+    # на миллионе строк копирование полей формы дороже самой проверки
+    for name, field in TimesheetRowForm.base_fields.items():
+        try:
+            row[name] = field.clean(values[name])
+        except ValidationError as exc:
+            errors.setdefault(name, []).extend(exc.messages)
+    if errors:
+        return None, errors
+
+    return Timesheet(
+        employee_id=employee_id, task_id=task_id, date=row['date'], hours=row['hours'],
+        notes=row['notes'], status=status,
+    ), None
+
+
+def import_timesheets(rows, reject=None, batch_size=IMPORT_BATCH_SIZE, result=None):
+    """
+    Импортировать строки из read_rows(). reject(line, record, errors) получает
+    каждую отклонённую строку. Каждая пачка пишется в своей транзакции;
+    итоги, недельный журнал и снимки зарплаты пересчитываются один раз в конце
+    (и без писем о переработке за прошлые недели) — даже если файл оборвался
+    ошибкой: уже записанные пачки остаются и должны быть согласованы.
+    result (ImportResult) заполняется по ходу — при ошибке по нему видно,
+    сколько записей сохранено.
+    """
+    employees, tasks = load_lookups()
+    if result is None:
+        result = ImportResult()
+    affected = set()
+    has_approved = False
+    batch = []
+
+    def flush():
+        with transaction.atomic():
+            Timesheet.objects.bulk_create(batch)
+            versions.bump((entry.employee_id, entry.date) for entry in batch)
+        result.created += len(batch)
+        # Пересчитываются только сотрудники из записанных пачек
+        affected.update(entry.employee_id for entry in batch)
+        batch.clear()
+
+    try:
+        for line, record in rows:
+            entry, errors = build_entry(record, employees, tasks)
+            if errors:
+                result.rejected += 1
+                if reject is not None:
+                    reject(line, record, errors)
+                continue
+            batch.append(entry)
+            has_approved = has_approved or entry.status == 'approved'
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    finally:
+        if result.created:
+            # bulk_create обходит save() и сигналы
+            if has_approved:
+                backfill_salary()
+            stats.rebuild(sorted(affected))
+            for employee_id in affected:
+                ledger.rebuild(employee_id=employee_id)
+    return result
+
+
+# --- Отчёт об отклонённых строках ---
+
+REJECT_HEADER = ['line', *REQUIRED_COLUMNS, 'errors']
+
+
+def format_errors(errors):
+    return '; '.join(f'{field}: {" ".join(messages)}' for field, messages in errors.items())
+
+
+def reject_row(line, record, errors):
+    return [line, *(_text(record.get(column)) for column in REQUIRED_COLUMNS), format_errors(errors)]
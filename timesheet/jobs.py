@@ -0,0 +1,161 @@
+import logging
+import traceback
+from contextlib import nullcontext, suppress
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Обработчики задач по kind. Обработчик получает payload и может вернуть
+# список писем (EmailMessage) — воркер отправит их через одно SMTP-соединение
+# на всю пачку задач. Обработчик выполняется в транзакции; atomic=False —
+# для долгих задач, чей прогресс должен быть виден другим соединениям сразу.
+HANDLERS = {}
+NON_ATOMIC = set()
+
+# Задача, которую сейчас выполняет воркер (для heartbeat)
+_current_job = ContextVar('current_job', default=None)
+
+
+def handler(kind, atomic=True):
+    def decorator(func):
+        HANDLERS[kind] = func
+        if not atomic:
+            NON_ATOMIC.add(kind)
+        return func
+    return decorator
+
+
+def enqueue(kind, **payload):
+    # Вызывается внутри транзакции запроса: задача появится только вместе с данными
+    return Job.objects.create(kind=kind, payload=payload)
+
+
+def _backoff(attempts):
+    base = getattr(settings, 'JOB_RETRY_BASE_DELAY', 30)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 60 * 60))
+
+
+def _lease():
+    return timedelta(seconds=getattr(settings, 'JOB_LEASE_TIMEOUT', 15 * 60))
+
+
+def requeue_stale(now=None):
+    """
+    Вернуть в очередь задачи, чья аренда (locked_at + JOB_LEASE_TIMEOUT) истекла:
+    воркер упал, не завершив их. Попытка засчитывается; исчерпавшие попытки — 'failed'.
+    """
+    now = now or timezone.now()
+    stale = Job.objects.filter(status='running', locked_at__lt=now - _lease())
+    error = 'Воркер не завершил задачу за время аренды.'
+    failed = stale.filter(attempts__gte=F('max_attempts') - 1).update(
+        status='failed', attempts=F('attempts') + 1, locked_at=None, finished_at=now, last_error=error,
+    )
+    requeued = stale.update(
+        status='queued', attempts=F('attempts') + 1, locked_at=None, run_after=now, last_error=error,
+    )
+    return requeued + failed
+
+
+def _renew(job):
+    """
+    Продлить аренду задачи. locked_at служит меткой владельца: если задачу уже
+    вернули в очередь и взял другой воркер, метка не совпадёт — вернётся False.
+    """
+    now = timezone.now()
+    renewed = Job.objects.filter(pk=job.pk, status='running', locked_at=job.locked_at).update(locked_at=now)
+    if renewed:
+        job.locked_at = now
+    return bool(renewed)
+
+
+def heartbeat():
+    """Продлить аренду текущей задачи — для долгих обработчиков (выгрузки и т.п.)."""
+    job = _current_job.get()
+    if job is not None:
+        _renew(job)
+
+
+def claim_jobs(limit, ids=None):
+    now = timezone.now()
+    requeue_stale(now)
+    queued = Job.objects.filter(status='queued', run_after__lte=now)
+    if ids is not None:
+        queued = queued.filter(id__in=ids)
+    with transaction.atomic():
+        ids = list(
+            queued.select_for_update(skip_locked=True)
+            .order_by('run_after', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        Job.objects.filter(id__in=ids, status='queued').update(status='running', locked_at=now)
+    return list(Job.objects.filter(id__in=ids, status='running', locked_at=now).order_by('id'))
+
+
+def _finish(job, error=None):
+    job.attempts += 1
+    if error is None:
+        job.status = 'done'
+        job.finished_at = timezone.now()
+        job.last_error = ''
+    elif job.attempts >= job.max_attempts:
+        job.status = 'failed'
+        job.finished_at = timezone.now()
+        job.last_error = error
+    else:
+        job.status = 'queued'
+        job.run_after = timezone.now() + _backoff(job.attempts)
+        job.last_error = error
+    job.locked_at = None
+    job.save(update_fields=['status', 'attempts', 'run_after', 'locked_at', 'last_error', 'finished_at'])
+
+
+def run_pending(limit=100, ids=None):
+    """Выполнить до limit готовых задач (только из ids, если заданы). Возвращает число обработанных."""
+    jobs = claim_jobs(limit, ids)
+    if not jobs:
+        return 0
+
+    # Одно SMTP-соединение на всю пачку: открывается при первом письме.
+    # Если send_messages() откроет его сам, то сам же и закроет после отправки
+    connection = get_connection()
+    opened = False
+    try:
+        for job in jobs:
+            # Пока шли предыдущие задачи пачки, аренда этой могла истечь и её взял другой воркер
+            if not _renew(job):
+                continue
+            token = _current_job.set(job)
+            try:
+                func = HANDLERS[job.kind]
+                with transaction.atomic() if job.kind not in NON_ATOMIC else nullcontext():
+                    messages = func(**job.payload) or []
+                if messages:
+                    if not opened:
+                        connection.open()
+                        opened = True
+                    connection.send_messages(messages)
+            except Exception:
+                logger.exception('Задача %s завершилась ошибкой', job)
+                _finish(job, traceback.format_exc(limit=5))
+                if opened:
+                    # Соединение могло оборваться — следующее письмо откроет новое
+                    with suppress(Exception):
+                        connection.close()
+                    opened = False
+            else:
+                _finish(job)
+            finally:
+                _current_job.reset(token)
+    finally:
+        if opened:
+            connection.close()
+    return len(jobs)
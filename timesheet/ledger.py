@@ -0,0 +1,122 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+
+from .jobs import enqueue
+from .models import Timesheet, WeeklyHours
+
+# Норма часов в неделю; всё сверх — переработка
+WEEKLY_NORM = 40
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def _approved(row):
+    return row is not None and row['status'] == 'approved'
+
+
+def apply_changes(changes):
+    """
+    Обновить журнал WeeklyHours по парам (было, стало) из Timesheet.snapshot()
+    и поставить уведомления о переработке — одно на сотрудника-неделю.
+    """
+    deltas = defaultdict(Decimal)
+    newly_approved = set()
+    for old, new in changes:
+        if _approved(old):
+            deltas[old['employee_id'], week_start(old['date'])] -= Decimal(str(old['hours']))
+        if _approved(new):
+            key = new['employee_id'], week_start(new['date'])
+            deltas[key] += Decimal(str(new['hours']))
+            if not _approved(old):
+                newly_approved.add(key)
+
+    if not any(deltas.values()):
+        return
+
+    with transaction.atomic():
+        for (employee_id, start), delta in deltas.items():
+            if not delta:
+                continue
+            updated = WeeklyHours.objects.filter(employee_id=employee_id, week_start=start).update(
+                approved_hours=F('approved_hours') + delta,
+            )
+            if not updated:
+                rebuild(employee_id=employee_id, weeks=[start])
+
+        if newly_approved:
+            notify_overtime(newly_approved)
+
+
+def notify_overtime(keys):
+    # Одно чтение журнала на всю пачку вместо SUM по записям недели на каждое одобрение
+    employee_ids = {employee_id for employee_id, _ in keys}
+    weeks = {start for _, start in keys}
+    rows = WeeklyHours.objects.filter(
+        employee_id__in=employee_ids, week_start__in=weeks, approved_hours__gt=WEEKLY_NORM,
+    ).values_list('employee_id', 'week_start', 'approved_hours')
+    for employee_id, start, total_hours in rows:
+        if (employee_id, start) in keys:
+            enqueue(
+                'overtime_email',
+                employee_id=employee_id,
+                week_start=start.isoformat(),
+                total_hours=str(total_hours),
+            )
+
+
+def compute(employee_id=None, weeks=None):
+    """Одобренные часы по (сотрудник, неделя), посчитанные по сырым Timesheet."""
+    queryset = Timesheet.objects.filter(status='approved')
+    if employee_id is not None:
+        queryset = queryset.filter(employee_id=employee_id)
+    if weeks:
+        queryset = queryset.filter(date__range=(min(weeks), max(weeks) + timedelta(days=6)))
+
+    totals = defaultdict(Decimal)
+    rows = queryset.values_list('employee_id', 'date', 'hours').iterator(chunk_size=5000)
+    for row_employee_id, day, hours in rows:
+        key = row_employee_id, week_start(day)
+        if weeks is None or key[1] in weeks:
+            totals[key] += hours
+    return totals
+
+
+def rebuild(employee_id=None, weeks=None):
+    """Пересчитать журнал целиком или для одного сотрудника и указанных недель."""
+    totals = compute(employee_id, weeks)
+    with transaction.atomic():
+        existing = WeeklyHours.objects.all()
+        if employee_id is not None:
+            existing = existing.filter(employee_id=employee_id)
+        if weeks is not None:
+            existing = existing.filter(week_start__in=weeks)
+        existing.delete()
+        WeeklyHours.objects.bulk_create(
+            [
+                WeeklyHours(employee_id=key[0], week_start=key[1], approved_hours=hours)
+                for key, hours in totals.items()
+            ],
+            batch_size=500,
+        )
+    return len(totals)
+
+
+def find_drift():
+    """Недели, где журнал расходится с сырыми данными: {(сотрудник, неделя): (в журнале, должно быть)}."""
+    expected = compute()
+    stored = {
+        (employee_id, start): hours
+        for employee_id, start, hours in WeeklyHours.objects.values_list('employee_id', 'week_start', 'approved_hours')
+    }
+    drift = {}
+    for key in expected.keys() | stored.keys():
+        actual, should_be = stored.get(key, Decimal(0)), expected.get(key, Decimal(0))
+        if actual != should_be:
+            drift[key] = (actual, should_be)
+    return drift
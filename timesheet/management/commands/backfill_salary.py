@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from timesheet.approval import backfill_salary
+
+
+class Command(BaseCommand):
+    help = 'Заполнить ставку и сумму на дату записи у одобренных записей, где их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Записей в одной транзакции')
+        parser.add_argument(
+            '--recompute', action='store_true',
+            help='Пересчитать все одобренные записи (после исправления истории ставок)',
+        )
+
+    def handle(self, *args, **options):
+        # Ставка — на дату каждой записи, по истории EmployeeRate
+        count = backfill_salary(batch_size=options['batch_size'], recompute=options['recompute'])
+        self.stdout.write(self.style.SUCCESS(f'Заполнено записей: {count}.'))
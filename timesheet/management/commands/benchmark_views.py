@@ -0,0 +1,163 @@
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from timesheet import jobs
+from timesheet.models import Employee, Timesheet
+from timesheet.querycount import QueryCounter
+from timesheet.roles import MANAGERS_GROUP
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогнать основные страницы через тестовый клиент на текущей БД '
+        '(см. seed_timesheets) и записать время, число SQL-запросов и пик памяти в JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='benchmarks.json', help='JSON-файл, куда дописывается прогон')
+        parser.add_argument('--repeat', type=int, default=3, help='Повторов на view; берётся медиана времени')
+        parser.add_argument('--label', default='', help='Метка прогона (ветка, описание изменения)')
+        parser.add_argument(
+            '--warm', action='store_true',
+            help='Не очищать кеши перед каждым замером (по умолчанию замеряется холодный кеш)',
+        )
+
+    def handle(self, *args, **options):
+        manager = User.objects.filter(groups__name=MANAGERS_GROUP).first()
+        employee = Employee.objects.select_related('user').order_by('-pk').first()
+        if manager is None or employee is None:
+            raise CommandError('Нужны менеджер и хотя бы один сотрудник — запустите manage.py seed_timesheets.')
+
+        latest = Timesheet.objects.order_by('-date').values_list('date', flat=True).first() or timezone.localdate()
+        month = latest.strftime('%Y-%m')
+        cases = [
+            ('list', manager, reverse('timesheet_list')),
+            ('list', employee.user, reverse('timesheet_list')),
+            ('report', manager, f"{reverse('report')}?month={month}"),
+            ('report', employee.user, f"{reverse('report')}?month={month}"),
+            ('export_month', manager, f"{reverse('export_excel')}?month={month}"),
+            ('export_full', manager, reverse('export_excel')),
+            ('export_full_csv', manager, f"{reverse('export_excel')}?format=csv"),
+            ('export_full_jsonl', manager, f"{reverse('export_excel')}?format=jsonl"),
+            ('send_report_email', manager, reverse('send_report_email')),
+        ]
+
+        self.warm = options['warm']
+        # testserver в ALLOWED_HOSTS и locmem-почта; бюджет запросов здесь только измеряем.
+        # Замеры изолированы от рабочего состояния: свой кеш в памяти и свой каталог
+        # кеша выгрузок, а всё, что записано в БД (сессии, задачи очереди, записи
+        # о выгрузках), откатывается в конце
+        try:
+            setup_test_environment()
+            own_environment = True
+        except RuntimeError:
+            own_environment = False  # уже внутри тестов
+        try:
+            with tempfile.TemporaryDirectory() as export_dir, override_settings(
+                QUERY_BUDGET_STRICT=False,
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'}},
+                EXPORT_ROOT=export_dir,
+                EXPORT_CACHE_ROOT=os.path.join(export_dir, 'cache'),
+            ), transaction.atomic():
+                results = [self.measure(name, user, url, options['repeat']) for name, user, url in cases]
+                results.append(self.measure_job(manager, options['repeat']))
+                transaction.set_rollback(True)
+        finally:
+            if own_environment:
+                teardown_test_environment()
+
+        run = {
+            'timestamp': timezone.now().isoformat(),
+            'label': options['label'],
+            'warm_cache': self.warm,
+            'rows': Timesheet.objects.count(),
+            'employees': Employee.objects.count(),
+            'results': results,
+        }
+        self.save(options['output'], run)
+
+        for result in results:
+            self.stdout.write(
+                f"{result['view']:<20} {result['user']:<16} {result['status']:>4} "
+                f"{result['wall_ms']:>10.1f} мс {result['queries']:>6} запросов {result['peak_kb']:>10.0f} КБ"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Результаты добавлены в {options['output']}"))
+
+    def request(self, client, url):
+        response = client.get(url)
+        # Потоковый ответ тоже нужно дочитать — иначе время генерации не попадёт в замер
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, len(body)
+
+    def measure(self, name, user, url, repeat):
+        client = Client()
+        client.force_login(user)
+        return self.run_case(name, user.username, url, lambda: self.request(client, url), repeat)
+
+    def measure_job(self, manager, repeat):
+        def run():
+            # Только своя задача — чужие из рабочей очереди не трогаем
+            job = jobs.enqueue('report_email', user_id=manager.pk)
+            jobs.run_pending(limit=1, ids=[job.pk])
+            return None, 0
+        return self.run_case('report_email_job', manager.username, '', run, repeat)
+
+    def run_case(self, name, username, url, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            self.reset_caches()
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                start = time.perf_counter()
+                response, size = func()
+                timings.append((time.perf_counter() - start) * 1000)
+
+        # Пик памяти — отдельным прогоном: tracemalloc заметно замедляет код
+        self.reset_caches()
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'view': name,
+            'user': username,
+            'url': url,
+            'status': response.status_code if response is not None else 0,
+            'bytes': size,
+            'wall_ms': round(statistics.median(timings), 2),
+            'queries': counter.count,
+            'sql_ms': round(counter.duration * 1000, 2),
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+    def reset_caches(self):
+        # Кеш здесь — отдельный LocMemCache замера (см. handle), рабочий не затрагивается
+        if not self.warm:
+            cache.clear()
+            shutil.rmtree(settings.EXPORT_CACHE_ROOT, ignore_errors=True)
+
+    def save(self, path, run):
+        try:
+            with open(path, encoding='utf-8') as f:
+                runs = json.load(f)
+        except FileNotFoundError:
+            runs = []
+        runs.append(run)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(runs, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,53 @@
+import csv
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from timesheet.importer import (
+    IMPORT_BATCH_SIZE, REJECT_HEADER, ImportFormatError, ImportResult, import_timesheets, read_rows, reject_row,
+)
+
+
+class Command(BaseCommand):
+    help = 'Импортировать записи Timesheet из CSV или XLSX (столбцы: employee, project, task, date, hours, notes, status)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл .csv или .xlsx')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--encoding', default='utf-8-sig', help='Кодировка CSV (например, cp1251)')
+        parser.add_argument(
+            '--rejects', help='Куда записать отклонённые строки (CSV); по умолчанию <path>.rejects.csv',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        rejects_path = options['rejects'] or f'{path}.rejects.csv'
+
+        # Отклонённые строки сразу пишутся в файл — отчёт не копится в памяти
+        progress = ImportResult()
+        try:
+            with open(path, 'rb') as source, open(rejects_path, 'w', newline='', encoding='utf-8-sig') as rejects:
+                writer = csv.writer(rejects)
+                writer.writerow(REJECT_HEADER)
+                result = import_timesheets(
+                    read_rows(source, path, encoding=options['encoding']),
+                    reject=lambda *args: writer.writerow(reject_row(*args)),
+                    batch_size=options['batch_size'],
+                    result=progress,
+                )
+        except ImportFormatError as exc:
+            if not progress.created:
+                os.remove(rejects_path)
+                raise CommandError(str(exc))
+            raise CommandError(f'{exc} Записей до ошибки сохранено: {progress.created}.')
+        except UnicodeDecodeError as exc:
+            raise CommandError(
+                f'Файл не в кодировке {options["encoding"]} ({exc}). '
+                f'Записей до ошибки сохранено: {progress.created}.'
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'Импортировано записей: {result.created}.'))
+        if result.rejected:
+            self.stdout.write(self.style.WARNING(f'Отклонено строк: {result.rejected} — см. {rejects_path}'))
+        else:
+            os.remove(rejects_path)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from timesheet import stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать таблицу EmployeeStats по записям Timesheet или проверить её на расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить: код выхода 1, если итоги разошлись с сырыми данными',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = stats.find_drift()
+            for employee_id, (actual, expected) in sorted(drift.items()):
+                self.stdout.write(f'Сотрудник {employee_id}: сохранено {actual}, должно быть {expected}')
+            if drift:
+                raise CommandError(f'Расхождения у {len(drift)} сотрудников. Запустите без --check для пересчёта.')
+            self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+            return
+
+        count = stats.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Итоги пересчитаны для {count} сотрудников.'))
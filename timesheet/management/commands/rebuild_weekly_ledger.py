@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from timesheet import ledger
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать журнал недельных часов WeeklyHours или сверить его с записями Timesheet'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить: код выхода 1, если журнал разошёлся с сырыми данными',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = ledger.find_drift()
+            for (employee_id, week_start), (actual, expected) in sorted(drift.items()):
+                self.stdout.write(
+                    f'Сотрудник {employee_id}, неделя с {week_start}: в журнале {actual}, должно быть {expected}'
+                )
+            if drift:
+                raise CommandError(f'Расхождений: {len(drift)}. Запустите без --check для пересчёта.')
+            self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+            return
+
+        count = ledger.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Журнал пересчитан: {count} сотрудник-недель.'))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from timesheet import jobs
+
+
+class Command(BaseCommand):
+    help = 'Воркер фоновых задач (письма и т.п.) из таблицы Job'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Обработать готовые задачи и выйти')
+        parser.add_argument('--batch-size', type=int, default=100, help='Сколько задач брать за раз')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Пауза (сек.), когда очередь пуста')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = jobs.run_pending(options['batch_size'])
+            if processed:
+                self.stdout.write(f'Обработано задач: {processed}')
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['sleep'])
@@ -0,0 +1,134 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from timesheet import ledger, stats, versions
+from timesheet.approval import backfill_salary
+from timesheet.models import Employee, Project, Task, Timesheet
+
+SEED_PREFIX = 'seed_'
+
+
+class Command(BaseCommand):
+    help = 'Заполнить БД реалистичным объёмом тестовых данных (сотрудники, проекты, задачи, записи за годы)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=50)
+        parser.add_argument('--projects', type=int, default=10)
+        parser.add_argument('--tasks-per-project', type=int, default=8)
+        parser.add_argument('--years', type=float, default=1.0, help='Глубина истории в годах')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора случайных чисел')
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        password = make_password('seed')  # один хеш на всех — хеширование дорогое
+
+        with transaction.atomic():
+            employees = self.create_employees(options['employees'], password, rnd)
+            tasks_by_employee = self.create_projects(
+                options['projects'], options['tasks_per_project'], employees, rnd,
+            )
+
+            total = 0
+            batch = []
+            for entry in self.generate_entries(employees, tasks_by_employee, options['years'], rnd):
+                batch.append(entry)
+                if len(batch) >= options['batch_size']:
+                    total += self.flush(batch)
+                    self.stdout.write(f'  записей: {total}')
+            total += self.flush(batch)
+
+            # bulk_create обходит save() и сигналы — снимок зарплаты
+            # и производные таблицы заполняем целиком
+            backfill_salary()
+            stats.rebuild()
+            ledger.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: {len(employees)} сотрудников, {options["projects"]} проектов, {total} записей. '
+            f'Вход: {SEED_PREFIX}manager / seed'
+        ))
+
+    def flush(self, batch):
+        Timesheet.objects.bulk_create(batch)
+        versions.bump((entry.employee_id, entry.date) for entry in batch)
+        count = len(batch)
+        batch.clear()
+        return count
+
+    def create_employees(self, count, password, rnd):
+        manager, _ = User.objects.get_or_create(
+            username=f'{SEED_PREFIX}manager', defaults={'password': password, 'email': 'manager@example.com'},
+        )
+        manager.groups.add(Group.objects.get_or_create(name='Managers')[0])
+
+        start = User.objects.filter(username__startswith=f'{SEED_PREFIX}user').count()
+        users = User.objects.bulk_create([
+            User(
+                username=f'{SEED_PREFIX}user{start + i}',
+                first_name=rnd.choice(['Анна', 'Иван', 'Мария', 'Пётр', 'Ольга', 'Сергей']),
+                last_name=rnd.choice(['Иванова', 'Петров', 'Смирнова', 'Кузнецов', 'Попова']),
+                email=f'{SEED_PREFIX}user{start + i}@example.com',
+                password=password,
+            )
+            for i in range(count)
+        ])
+        return Employee.objects.bulk_create([
+            Employee(user=user, hourly_rate=Decimal(rnd.randrange(800, 5000)) / 100)
+            for user in users
+        ])
+
+    def create_projects(self, count, tasks_per_project, employees, rnd):
+        projects = Project.objects.bulk_create([
+            Project(name=f'Проект {SEED_PREFIX}{i}') for i in range(count)
+        ])
+        tasks = Task.objects.bulk_create([
+            Task(name=f'Задача {j}', project=project)
+            for project in projects
+            for j in range(tasks_per_project)
+        ])
+        tasks_by_project = {}
+        for task in tasks:
+            tasks_by_project.setdefault(task.project_id, []).append(task)
+
+        memberships = []
+        tasks_by_employee = {}
+        for employee in employees:
+            chosen = rnd.sample(projects, k=min(len(projects), rnd.randint(1, 3)))
+            memberships.extend(
+                Project.employees.through(project_id=project.pk, employee_id=employee.pk) for project in chosen
+            )
+            tasks_by_employee[employee.pk] = [task for project in chosen for task in tasks_by_project[project.pk]]
+        Project.employees.through.objects.bulk_create(memberships)
+        return tasks_by_employee
+
+    def generate_entries(self, employees, tasks_by_employee, years, rnd):
+        today = timezone.localdate()
+        first_day = today - timedelta(days=int(365 * years))
+        recent = today - timedelta(days=14)
+        day = first_day
+        while day <= today:
+            if day.weekday() < 5:
+                for employee in employees:
+                    # 1–3 записи в день, в сумме около 8 часов
+                    parts = rnd.randint(1, 3)
+                    for _ in range(parts):
+                        if day >= recent:
+                            status = 'pending'
+                        else:
+                            status = rnd.choices(['approved', 'rejected', 'pending'], weights=[92, 3, 5])[0]
+                        yield Timesheet(
+                            employee=employee,
+                            task=rnd.choice(tasks_by_employee[employee.pk]),
+                            date=day,
+                            hours=(Decimal(rnd.choice([4, 6, 8, 9, 10])) / parts).quantize(Decimal('0.01')),
+                            status=status,
+                        )
+            day += timedelta(days=1)
@@ -0,0 +1,82 @@
+import logging
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from .querycount import QueryCounter
+
+logger = logging.getLogger(__name__)
+
+
+class SQLProfilingMiddleware:
+    """
+    Профилирование SQL на каждый запрос: число запросов, суммарное время и самые
+    медленные statements. В режиме DEBUG или для staff-пользователей результат
+    уходит в заголовок Server-Timing (виден во вкладке Network браузера) и в лог:
+    уровнем INFO, а если SQL занял больше SQL_PROFILING_SLOW_MS — WARNING.
+    Запросы потоковых ответов (CSV, JSON Lines) считаются до конца передачи тела.
+
+    Включается настройкой SQL_PROFILING; при выключенной Django вообще не
+    вставляет middleware в цепочку (MiddlewareNotUsed), так что накладных расходов нет.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SQL_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.keep_slowest = getattr(settings, 'SQL_PROFILING_SLOWEST', 5)
+
+    def __call__(self, request):
+        profiler = QueryCounter(keep_slowest=self.keep_slowest)
+        with connection.execute_wrapper(profiler):
+            response = self.get_response(request)
+
+        if settings.DEBUG or self._is_staff(request):
+            # Заголовки уходят до тела: для потокового ответа в них только запросы
+            # до начала передачи, полный итог — в логе, когда поток закроется
+            response['Server-Timing'] = self.server_timing(profiler)
+            if response.streaming:
+                response.streaming_content = self._profile_stream(request, response.streaming_content, profiler)
+            else:
+                self._log(request, profiler)
+        return response
+
+    def _profile_stream(self, request, chunks, profiler):
+        iterator = iter(chunks)
+        try:
+            while True:
+                # Обёртка ставится только на время получения порции: между порциями
+                # соединение может использовать кто угодно ещё
+                with connection.execute_wrapper(profiler):
+                    chunk = next(iterator, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            self._log(request, profiler, streamed=True)
+
+    def _log(self, request, profiler, streamed=False):
+        # Каждый запрос — в INFO; медленные (по суммарному времени SQL) — предупреждением
+        elapsed_ms = profiler.duration * 1000
+        slow = elapsed_ms >= getattr(settings, 'SQL_PROFILING_SLOW_MS', 500)
+        level = logging.WARNING if slow else logging.INFO
+        logger.log(
+            level, '%s %s: %d SQL-запросов, %.1f мс%s',
+            request.method, request.path, profiler.count, elapsed_ms, ' (с потоковым телом)' if streamed else '',
+        )
+
+    @staticmethod
+    def _is_staff(request):
+        user = getattr(request, 'user', None)
+        return user is not None and user.is_authenticated and user.is_staff
+
+    @staticmethod
+    def server_timing(profiler):
+        metrics = [f'sql;dur={profiler.duration * 1000:.2f};desc="{profiler.count} queries"']
+        for index, (elapsed, sql) in enumerate(profiler.slowest(), start=1):
+            # В заголовке допустимы не все символы — оставляем начало запроса без кавычек
+            desc = ' '.join(sql.split())[:100].replace('"', "'").replace('\\', '')
+            desc = desc.encode('ascii', 'replace').decode()
+            metrics.append(f'sql-{index};dur={elapsed * 1000:.2f};desc="{desc}"')
+        return ', '.join(metrics)
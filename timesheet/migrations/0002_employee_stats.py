@@ -0,0 +1,43 @@
+# Generated by Django 5.1 on 2026-10-18 07:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def fill_employee_stats(apps, schema_editor):
+    Timesheet = apps.get_model('timesheet', 'Timesheet')
+    EmployeeStats = apps.get_model('timesheet', 'EmployeeStats')
+    rows = Timesheet.objects.values('employee_id').annotate(
+        entry_count=Count('id'),
+        total_hours=Sum('hours'),
+        pending_hours=Sum('hours', filter=Q(status='pending')),
+        approved_hours=Sum('hours', filter=Q(status='approved')),
+        rejected_hours=Sum('hours', filter=Q(status='rejected')),
+    ).order_by()
+    EmployeeStats.objects.bulk_create(
+        [EmployeeStats(**{key: value or 0 for key, value in row.items()}) for row in rows],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timesheet', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmployeeStats',
+            fields=[
+                ('employee', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='timesheet.employee')),
+                ('entry_count', models.PositiveIntegerField(default=0)),
+                ('total_hours', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('pending_hours', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('approved_hours', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('rejected_hours', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+        ),
+        migrations.RunPython(fill_employee_stats, migrations.RunPython.noop),
+    ]
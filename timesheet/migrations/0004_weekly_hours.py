@@ -0,0 +1,47 @@
+# Generated by Django 5.1 on 2026-10-18 07:16
+
+import django.db.models.deletion
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def fill_weekly_hours(apps, schema_editor):
+    Timesheet = apps.get_model('timesheet', 'Timesheet')
+    WeeklyHours = apps.get_model('timesheet', 'WeeklyHours')
+    totals = defaultdict(Decimal)
+    rows = Timesheet.objects.filter(status='approved').values_list('employee_id', 'date', 'hours')
+    for employee_id, day, hours in rows.iterator():
+        totals[employee_id, day - timedelta(days=day.weekday())] += hours
+    WeeklyHours.objects.bulk_create(
+        [
+            WeeklyHours(employee_id=employee_id, week_start=week_start, approved_hours=hours)
+            for (employee_id, week_start), hours in totals.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timesheet', '0003_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeeklyHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start', models.DateField()),
+                ('approved_hours', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='timesheet.employee')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('employee', 'week_start'), name='unique_employee_week')],
+            },
+        ),
+        migrations.RunPython(fill_weekly_hours, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1 on 2026-10-18 07:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timesheet', '0004_weekly_hours'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='timesheet',
+            index=models.Index(fields=['employee', 'date'], name='timesheet_employee_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timesheet',
+            index=models.Index(fields=['status', 'date'], name='timesheet_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timesheet',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['employee', 'date'], name='timesheet_pending_emp_date_idx'),
+        ),
+    ]
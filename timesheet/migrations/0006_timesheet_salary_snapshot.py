@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-18 07:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timesheet', '0005_timesheet_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timesheet',
+            name='rate_at_approval',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=6, null=True),
+        ),
+        migrations.AddField(
+            model_name='timesheet',
+            name='salary_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-18 07:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timesheet', '0006_timesheet_salary_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmployeeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hourly_rate', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('valid_from', models.DateField()),
+                ('valid_to', models.DateField(blank=True, null=True)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rates', to='timesheet.employee')),
+            ],
+            options={
+                'ordering': ['employee', 'valid_from'],
+                'constraints': [models.UniqueConstraint(fields=('employee', 'valid_from'), name='unique_employee_rate_start')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-18 07:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timesheet', '0007_employee_rate'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='timesheet',
+            index=models.Index(fields=['task', 'date'], name='timesheet_task_date_idx'),
+        ),
+    ]
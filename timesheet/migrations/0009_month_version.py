@@ -0,0 +1,27 @@
+# Generated by Django 5.1 on 2026-10-18 07:43
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timesheet', '0008_timesheet_task_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.PositiveIntegerField()),
+                ('month', models.DateField()),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('scope', 'month'), name='unique_scope_month')],
+            },
+        ),
+    ]
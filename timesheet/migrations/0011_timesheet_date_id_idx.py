@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-18 08:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timesheet', '0010_export_job'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='timesheet',
+            index=models.Index(fields=['date', 'id'], name='timesheet_date_id_idx'),
+        ),
+    ]
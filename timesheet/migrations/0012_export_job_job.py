@@ -0,0 +1,19 @@
+# Generated by Django 5.1 on 2026-10-18 08:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timesheet', '0011_timesheet_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='job',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='timesheet.job'),
+        ),
+    ]
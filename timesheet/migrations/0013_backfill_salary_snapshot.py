@@ -0,0 +1,49 @@
+from django.db import migrations
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Round
+
+BATCH_SIZE = 10000
+
+
+def backfill_salary_snapshot(apps, schema_editor):
+    # Одобренные до 0006 записи остались без снимка: ставка на дату записи
+    # (история EmployeeRate, иначе текущая ставка сотрудника), как в rates.effective_rate.
+    # Исторические модели — поэтому выражение повторено здесь, а не импортировано
+    Timesheet = apps.get_model('timesheet', 'Timesheet')
+    Employee = apps.get_model('timesheet', 'Employee')
+    EmployeeRate = apps.get_model('timesheet', 'EmployeeRate')
+    MonthVersion = apps.get_model('timesheet', 'MonthVersion')
+
+    history = EmployeeRate.objects.filter(
+        Q(valid_to__isnull=True) | Q(valid_to__gt=OuterRef('date')),
+        employee=OuterRef('employee_id'),
+        valid_from__lte=OuterRef('date'),
+    ).order_by('-valid_from').values('hourly_rate')[:1]
+    current = Employee.objects.filter(pk=OuterRef('employee_id')).values('hourly_rate')[:1]
+    rate = Coalesce('rate_at_approval', Subquery(history), Subquery(current))
+    amount = ExpressionWrapper(F('hours') * rate, output_field=DecimalField(max_digits=12, decimal_places=2))
+
+    pending = Timesheet.objects.filter(status='approved', salary_amount__isnull=True)
+    updated = 0
+    last_pk = 0
+    while True:
+        pks = list(pending.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE])
+        if not pks:
+            break
+        updated += Timesheet.objects.filter(pk__in=pks).update(rate_at_approval=rate, salary_amount=Round(amount, 2))
+        last_pk = pks[-1]
+
+    if updated:
+        # Закешированные итоги отчётов собраны без этих сумм — поднимаем все версии
+        MonthVersion.objects.update(version=F('version') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timesheet', '0012_export_job_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_salary_snapshot, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,9 @@
-from django.db import models
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 
 class Employee(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -9,6 +12,25 @@ class Employee(models.Model):
     def __str__(self):
         return self.user.username
 
+class EmployeeRate(models.Model):
+    # История ставок: ставка действует на [valid_from, valid_to), valid_to = NULL — по сей день.
+    # Даты, не покрытые историей, считаются по Employee.hourly_rate.
+    # Новая ставка заводится через rates.set_rate — он закрывает предыдущий интервал
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='rates')
+    hourly_rate = models.DecimalField(max_digits=6, decimal_places=2)
+    valid_from = models.DateField()
+    valid_to = models.DateField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['employee', 'valid_from']
+        constraints = [
+            # Уникальность заодно даёт индекс (employee, valid_from) для поиска ставки на дату
+            models.UniqueConstraint(fields=['employee', 'valid_from'], name='unique_employee_rate_start'),
+        ]
+
+    def __str__(self):
+        return f"{self.employee_id}: {self.hourly_rate} с {self.valid_from}"
+
 class Project(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -38,11 +60,192 @@ class Timesheet(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Ставка и сумма, зафиксированные при одобрении: отчёты суммируют salary_amount
+    # без JOIN к Employee, а повышение ставки не переписывает закрытые месяцы.
+    # У неодобренных записей — NULL
+    rate_at_approval = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
+    salary_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Список менеджера без фильтров: ORDER BY date DESC, id DESC с курсором
+            # date <= ... — страница читается по индексу, без сортировки всей таблицы
+            models.Index(fields=['date', 'id'], name='timesheet_date_id_idx'),
+            # Список сотрудника: WHERE employee = ... ORDER BY date DESC, id DESC
+            models.Index(fields=['employee', 'date'], name='timesheet_employee_date_idx'),
+            # Отчёты и экспорт: WHERE status = 'approved' AND date BETWEEN ...
+            models.Index(fields=['status', 'date'], name='timesheet_status_date_idx'),
+            # Фильтр списка по задаче или проекту (task IN задачи проекта) с сортировкой по дате
+            models.Index(fields=['task', 'date'], name='timesheet_task_date_idx'),
+            # Ожидающие одобрения записи сотрудника (неделя в сетке, массовое одобрение) —
+            # малая часть таблицы, поэтому частичный индекс
+            models.Index(
+                fields=['employee', 'date'],
+                condition=models.Q(status='pending'),
+                name='timesheet_pending_emp_date_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.employee.user.username} - {self.date} - {self.hours}h"
 
+    # Снимок значений, из которых считаются производные таблицы (EmployeeStats и т.п.).
+    # Исходный снимок запоминается при загрузке из БД, чтобы при сохранении
+    # обновлять статистику по разнице, не перечитывая строку.
+    SNAPSHOT_FIELDS = ('employee_id', 'task_id', 'date', 'hours', 'status')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if all(f in instance.__dict__ for f in cls.SNAPSHOT_FIELDS):
+            instance._original = instance.snapshot()
+        return instance
+
+    def snapshot(self):
+        return {f: getattr(self, f) for f in self.SNAPSHOT_FIELDS}
+
+    def save(self, *args, **kwargs):
+        self.snapshot_salary()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'rate_at_approval', 'salary_amount'}
+        # Запись и обработчики post_save (статистика) — в одной транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def snapshot_salary(self):
+        # Ставка на дату записи берётся при переходе в 'approved' и дальше не меняется;
+        # правка часов одобренной записи пересчитывает сумму по той же ставке
+        if self.status != 'approved':
+            self.rate_at_approval = self.salary_amount = None
+            return
+        if self.rate_at_approval is None:
+            from .rates import rate_on  # rates.py импортирует модели
+            self.rate_at_approval = rate_on(self.employee_id, self.date)
+        amount = Decimal(self.hours) * Decimal(self.rate_at_approval)
+        self.salary_amount = amount.quantize(Decimal('0.01'), ROUND_HALF_UP)
+
     @property
     def total_salary(self):
+        if self.salary_amount is not None:
+            return self.salary_amount
         return self.hours * self.employee.hourly_rate
-    
\ No newline at end of file
+
+
+class EmployeeStats(models.Model):
+    # Денормализованные итоги по сотруднику для главной страницы.
+    # Обновляются в signals.py при каждом изменении Timesheet;
+    # пересчёт и проверка — manage.py rebuild_employee_stats
+    employee = models.OneToOneField(Employee, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    entry_count = models.PositiveIntegerField(default=0)
+    total_hours = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    pending_hours = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    approved_hours = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    rejected_hours = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.employee_id}: {self.entry_count} записей, {self.total_hours} ч"
+
+
+class Job(models.Model):
+    # Фоновая задача: отправка писем и т.п. Выполняется воркером manage.py run_jobs
+    STATUS_CHOICES = [
+        ('queued', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Выполнено'),
+        ('failed', 'Ошибка'),
+    ]
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+class WeeklyHours(models.Model):
+    # Одобренные часы сотрудника за ISO-неделю (week_start — понедельник).
+    # Ведётся в signals.py при одобрении, правке, отклонении и удалении записей;
+    # сверка с сырыми данными — manage.py rebuild_weekly_ledger
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE)
+    week_start = models.DateField()
+    approved_hours = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['employee', 'week_start'], name='unique_employee_week'),
+        ]
+
+    def __str__(self):
+        return f"{self.employee_id}: неделя с {self.week_start} — {self.approved_hours} ч"
+
+
+class MonthVersion(models.Model):
+    # Версия данных Timesheet за месяц: увеличивается при любом изменении записей
+    # этого месяца (versions.py, из сигнала timesheets_changed). Входит в ключи
+    # кеша отчётов — устаревшие ключи просто перестают читаться.
+    # scope — id сотрудника или 0 (все сотрудники, для менеджера)
+    scope = models.PositiveIntegerField()
+    month = models.DateField()  # первое число месяца
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'month'], name='unique_scope_month'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}: {self.month:%Y-%m} v{self.version}"
+
+
+class ExportJob(models.Model):
+    # Фоновая выгрузка в Excel (exports.py): собирается воркером manage.py run_jobs
+    # в файл EXPORT_ROOT/file_name. data_version — версия данных (versions.watermark),
+    # по которой собран файл: та же выгрузка при той же версии не собирается заново
+    STATUS_CHOICES = Job.STATUS_CHOICES
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    # Задача очереди, которая собирает файл: если она упала окончательно
+    # (в том числе по истечении аренды), выгрузка не переиспользуется
+    job = models.ForeignKey(Job, on_delete=models.SET_NULL, null=True, blank=True)
+    month = models.DateField(null=True, blank=True)  # первое число месяца; NULL — вся история
+    data_version = models.PositiveIntegerField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    rows_done = models.PositiveIntegerField(default=0)
+    rows_total = models.PositiveIntegerField(default=0)
+    file_name = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['month', 'data_version'])]
+
+    def __str__(self):
+        return f"Выгрузка #{self.pk} ({self.status})"
+
+    @property
+    def effective_status(self):
+        # Воркер мог упасть, не успев отметить выгрузку: тогда решает статус задачи очереди
+        if self.status in ('queued', 'running') and self.job is not None and self.job.status == 'failed':
+            return 'failed'
+        return self.status
+
+    @property
+    def path(self):
+        from .exports import export_root
+        return export_root() / self.file_name
+
+    @property
+    def download_name(self):
+        from .exports import export_filename
+        return export_filename(self.month, timezone.localdate(self.created_at))
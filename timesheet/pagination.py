@@ -0,0 +1,148 @@
+import base64
+import json
+from datetime import date
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import Http404
+from django.utils.http import urlencode
+
+
+# Курсорная (keyset) пагинация по (date, id).
+# В отличие от OFFSET, каждая страница стоит одинаково: запрос всегда
+# "WHERE date <= d AND (date < d OR id < i) ORDER BY date DESC, id DESC LIMIT N".
+# Условие date <= d — диапазон, по которому планировщик спускается в индекс
+# (date, id) (или (employee, date) и т.п. при фильтрах) и читает страницу по
+# порядку индекса, без сортировки. Для этого нужен индекс, начинающийся с date
+# или с фильтруемого поля и date — см. Timesheet.Meta.indexes.
+# В курсор можно положить состояние (фильтры списка) — соседние страницы
+# открываются с теми же условиями, даже если GET-параметры потерялись.
+
+def _dump(payload, state):
+    if state:
+        payload['s'] = state
+    payload = json.dumps(payload, separators=(',', ':'), ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _load(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(payload, dict) or not isinstance(payload.get('s', {}), dict):
+            raise TypeError(payload)
+        return payload
+    except (ValueError, TypeError):
+        raise Http404('Неверный курсор страницы.')
+
+
+def encode_cursor(obj, state=None):
+    return _dump({'d': obj.date.isoformat(), 'i': obj.pk}, state)
+
+
+def decode_cursor(token):
+    payload = _load(token)
+    try:
+        return date.fromisoformat(payload['d']), int(payload['i'])
+    except (ValueError, TypeError, KeyError):
+        raise Http404('Неверный курсор страницы.')
+
+
+def cursor_state(params):
+    """Состояние из курсора after/before в GET-параметрах или None, если курсора нет."""
+    token = params.get('after') or params.get('before')
+    return _load(token).get('s', {}) if token else None
+
+
+def get_page_size(params):
+    default = getattr(settings, 'TIMESHEET_PAGE_SIZE', 50)
+    maximum = getattr(settings, 'TIMESHEET_MAX_PAGE_SIZE', 500)
+    try:
+        size = int(params.get('page_size', default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, maximum))
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, prev_cursor, page_size, extra_params=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.page_size = page_size
+        self.extra_params = extra_params or {}
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def _query(self, key, cursor):
+        params = dict(self.extra_params)
+        params[key] = cursor
+        if self.page_size != getattr(settings, 'TIMESHEET_PAGE_SIZE', 50):
+            params['page_size'] = self.page_size
+        return '?' + urlencode(params)
+
+    @property
+    def next_query(self):
+        return self._query('after', self.next_cursor) if self.has_next else ''
+
+    @property
+    def prev_query(self):
+        return self._query('before', self.prev_cursor) if self.has_previous else ''
+
+
+def paginate_keyset(queryset, params, extra_params=None, state=None):
+    """
+    Вернуть страницу queryset'а (новые записи первыми) по курсору из GET-параметров.
+    extra_params сохраняются в ссылках на соседние страницы (например, month),
+    state — внутри самих курсоров (см. cursor_state).
+    """
+    page_size = get_page_size(params)
+    after = params.get('after')
+    before = params.get('before')
+
+    if before:
+        d, pk = decode_cursor(before)
+        rows = list(
+            queryset.filter(Q(date__gt=d) | Q(pk__gt=pk), date__gte=d)
+            .order_by('date', 'id')[:page_size + 1]
+        )
+        has_more = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        has_prev, has_next = has_more, True
+    else:
+        if after:
+            d, pk = decode_cursor(after)
+            queryset = queryset.filter(Q(date__lt=d) | Q(pk__lt=pk), date__lte=d)
+        rows = list(queryset.order_by('-date', '-id')[:page_size + 1])
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        has_prev = bool(after)
+
+    next_cursor = encode_cursor(rows[-1], state) if rows and has_next else None
+    prev_cursor = encode_cursor(rows[0], state) if rows and has_prev else None
+    return KeysetPage(rows, next_cursor, prev_cursor, page_size, extra_params)
+
+
+def paginate_by_pk(queryset, params, extra_params=None, state=None):
+    """
+    Страница строк values() по возрастанию id — для выгрузок и синхронизации
+    (новые записи всегда в конце). Только вперёд: курсор after.
+    """
+    page_size = get_page_size(params)
+    after = params.get('after')
+    if after:
+        try:
+            queryset = queryset.filter(pk__gt=int(_load(after)['i']))
+        except (ValueError, TypeError, KeyError):
+            raise Http404('Неверный курсор страницы.')
+    rows = list(queryset.order_by('pk')[:page_size + 1])
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = _dump({'i': rows[-1]['id']}, state) if has_next else None
+    return KeysetPage(rows, next_cursor, None, page_size, extra_params)
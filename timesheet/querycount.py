@@ -0,0 +1,75 @@
+import functools
+import heapq
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryCounter:
+    """
+    Execute-wrapper для connection.execute_wrapper(): считает запросы и их время.
+    При keep_slowest > 0 дополнительно хранит столько самых медленных SQL.
+    """
+
+    def __init__(self, keep_slowest=0):
+        self.count = 0
+        self.duration = 0.0
+        self.keep_slowest = keep_slowest
+        self._slowest = []  # куча (время, номер, sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            if self.keep_slowest:
+                item = (elapsed, self.count, sql)
+                if len(self._slowest) < self.keep_slowest:
+                    heapq.heappush(self._slowest, item)
+                else:
+                    heapq.heappushpop(self._slowest, item)
+
+    def slowest(self):
+        """Самые медленные запросы: [(время в секундах, sql)], начиная с самого долгого."""
+        return [(elapsed, sql) for elapsed, _, sql in sorted(self._slowest, reverse=True)]
+
+
+def query_budget(max_queries):
+    """
+    Ограничение числа SQL-запросов на одну view (включая рендер шаблона).
+    При превышении пишет предупреждение в лог, а при QUERY_BUDGET_STRICT = True
+    (включается в тестах) выбрасывает QueryBudgetExceeded — так N+1 сразу ломает тесты.
+    Для class-based views: @method_decorator(query_budget(N), name='dispatch').
+    """
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                response = view_func(request, *args, **kwargs)
+                # TemplateResponse рендерится лениво — запросы из шаблона тоже считаем
+                if hasattr(response, 'render') and not response.is_rendered:
+                    response.render()
+
+            if counter.count > max_queries:
+                message = (
+                    f'{request.method} {request.path}: {counter.count} SQL-запросов '
+                    f'при бюджете {max_queries}'
+                )
+                if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,63 @@
+from datetime import date
+
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Employee, EmployeeRate
+
+# Начало истории для ставки, действовавшей до первого изменения
+HISTORY_START = date(2000, 1, 1)
+
+
+def effective_rate(employee, day):
+    """
+    Ставка сотрудника на дату — выражение для annotate()/update().
+    employee и day — OuterRef/F/Value; на строку один поиск по индексу
+    (employee, valid_from), без запроса на каждую запись из Python.
+    """
+    history = EmployeeRate.objects.filter(
+        Q(valid_to__isnull=True) | Q(valid_to__gt=day),
+        employee=employee,
+        valid_from__lte=day,
+    ).order_by('-valid_from').values('hourly_rate')[:1]
+    current = Employee.objects.filter(pk=employee).values('hourly_rate')[:1]
+    return Coalesce(Subquery(history), Subquery(current))
+
+
+def rate_on(employee_id, day):
+    """Ставка сотрудника на дату одним запросом."""
+    return Employee.objects.filter(pk=employee_id).annotate(
+        rate=effective_rate(OuterRef('pk'), Value(day)),
+    ).values_list('rate', flat=True).get()
+
+
+def set_rate(employee, hourly_rate, valid_from):
+    """
+    Завести ставку с даты valid_from. Интервал, в который попадает valid_from,
+    закрывается этой датой; новый действует до начала следующего (если ставка
+    вставляется в прошлое) или бессрочно. Уже одобренные записи не меняются —
+    для пересчёта их снимков есть manage.py backfill_salary --recompute.
+    """
+    with transaction.atomic():
+        rates = EmployeeRate.objects.select_for_update().filter(employee=employee)
+        if not rates.exists():
+            # Прежняя ставка не должна пропасть для дат до valid_from
+            EmployeeRate.objects.create(
+                employee=employee, hourly_rate=employee.hourly_rate, valid_from=HISTORY_START,
+            )
+        rates.filter(
+            Q(valid_to__isnull=True) | Q(valid_to__gt=valid_from),
+            valid_from__lt=valid_from,
+        ).update(valid_to=valid_from)
+        next_start = rates.filter(valid_from__gt=valid_from).order_by('valid_from').values_list(
+            'valid_from', flat=True,
+        ).first()
+        rate, _ = EmployeeRate.objects.update_or_create(
+            employee=employee, valid_from=valid_from,
+            defaults={'hourly_rate': hourly_rate, 'valid_to': next_start},
+        )
+        if next_start is None:
+            Employee.objects.filter(pk=employee.pk).update(hourly_rate=hourly_rate)
+            employee.hourly_rate = hourly_rate
+    return rate
@@ -0,0 +1,160 @@
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.core.cache import cache
+from django.db.models import DecimalField, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .choices import choices_version
+from .exports import export_pipeline
+from .models import Timesheet
+
+# Итоги отчёта кешируются по (месяц, область, версия месяца). Версия растёт при
+# любом изменении записей месяца, поэтому TTL нужен только для уборки памяти:
+# закрытые месяцы меняются редко — храним долго, текущий — час
+REPORT_CACHE_TIMEOUT = 60 * 60
+REPORT_CACHE_TIMEOUT_CLOSED = 60 * 60 * 24 * 30
+
+
+def month_bounds(month_str):
+    """Первый и последний день месяца 'YYYY-MM'; при неверном значении — текущий месяц."""
+    try:
+        start_date = parse_date(f"{month_str}-01") if month_str else None
+    except ValueError:
+        start_date = None
+    if start_date is None:
+        start_date = timezone.localdate().replace(day=1)
+    end_date = start_date + relativedelta(months=1) - relativedelta(days=1)
+    return start_date, end_date
+
+
+def _full_name(first_name, last_name, username):
+    return f"{first_name} {last_name}".strip() or username
+
+
+def salary_summary(queryset):
+    """
+    Итоги по часам и зарплате одним GROUP BY (сотрудник, проект):
+    общие суммы и подытоги по сотрудникам и проектам собираются из его строк.
+    Зарплата — сумма зафиксированных при одобрении salary_amount;
+    записи без снимка (NULL) считаются нулём, а не роняют отчёт.
+    """
+    groups = queryset.values(
+        'employee_id',
+        'employee__user__first_name',
+        'employee__user__last_name',
+        'employee__user__username',
+        'task__project_id',
+        'task__project__name',
+    ).annotate(
+        group_hours=Coalesce(Sum('hours'), Value(Decimal(0)), output_field=DecimalField()),
+        group_salary=Coalesce(Sum('salary_amount'), Value(Decimal(0)), output_field=DecimalField()),
+    ).order_by('employee__user__username', 'task__project__name')
+
+    summary = {
+        'total_hours': Decimal(0),
+        'total_salary': Decimal(0),
+        'by_employee': OrderedDict(),
+        'by_project': {},
+    }
+    for group in groups:
+        hours, salary = group['group_hours'], group['group_salary']
+        summary['total_hours'] += hours
+        summary['total_salary'] += salary
+
+        employee = summary['by_employee'].setdefault(group['employee_id'], {
+            'name': _full_name(
+                group['employee__user__first_name'],
+                group['employee__user__last_name'],
+                group['employee__user__username'],
+            ),
+            'hours': Decimal(0),
+            'salary': Decimal(0),
+        })
+        employee['hours'] += hours
+        employee['salary'] += salary
+
+        project = summary['by_project'].setdefault(group['task__project_id'], {
+            'name': group['task__project__name'],
+            'hours': Decimal(0),
+            'salary': Decimal(0),
+        })
+        project['hours'] += hours
+        project['salary'] += salary
+
+    summary['by_employee'] = list(summary['by_employee'].values())
+    summary['by_project'] = sorted(summary['by_project'].values(), key=lambda p: p['name'])
+    return summary
+
+
+def cached_salary_summary(queryset, start_date, end_date, scope_key, version):
+    """
+    salary_summary(queryset) за месяц [start_date, end_date] через кеш.
+    scope_key — имя области (все сотрудники или сотрудник), version — версия
+    месяца этой области (versions.watermark). В ключе и версия подписей
+    (choices_version): после переименования сотрудника или проекта итоги
+    собираются заново, хотя записи месяца не менялись.
+    """
+    key = f'timesheet:report:{start_date:%Y-%m}:{scope_key}:{version}:{choices_version()}'
+    summary = cache.get(key)
+    if summary is None:
+        summary = salary_summary(queryset)
+        closed = end_date < timezone.localdate()
+        cache.set(key, summary, REPORT_CACHE_TIMEOUT_CLOSED if closed else REPORT_CACHE_TIMEOUT)
+    return summary
+
+
+def build_report_text():
+    """Текстовый отчёт по всем одобренным записям (для письма менеджеру)."""
+    # Те же строки и итоги, что и в выгрузке, — конвейер exports.export_pipeline
+    rows, totals = export_pipeline(
+        Timesheet.objects.filter(status='approved'),
+        ordering=('employee__user__username', '-date'),
+    )
+
+    # Собираем текст отчёта
+    report_lines = [
+        "ОТЧЁТ ПО РАБОЧИМ ЧАСАМ И ЗАРПЛАТЕ",
+        "=" * 50,
+        ""
+    ]
+
+    # Группы — по id сотрудника: имя только подпись, у тёзок свои итоги
+    current_employee = None
+    hours = salary = Decimal(0)
+    for row in rows:
+        if current_employee != row.employee_id:
+            if current_employee is not None:
+                report_lines.append(_employee_total(hours, salary))
+                report_lines.append("")
+            current_employee = row.employee_id
+            hours = salary = Decimal(0)
+            report_lines.append(f"Сотрудник: {row.employee}")
+            report_lines.append("-" * 40)
+
+        report_lines.append(
+            f"{row.date.strftime('%d.%m.%Y')} | {row.project} → {row.task} | {row.hours} ч × {row.rate} ₽/ч | {row.salary} ₽"
+        )
+        hours += row.hours
+        salary += row.salary
+    if current_employee is not None:
+        report_lines.append(_employee_total(hours, salary))
+
+    report_lines.extend([
+        "",
+        "=" * 50,
+        f"ИТОГО ЧАСОВ: {float(totals.hours)}",
+        f"ИТОГО ЗАРПЛАТА: {float(totals.salary)} ₽",
+        "",
+        f"Отчёт сформирован {datetime.now().strftime('%d.%m.%Y в %H:%M')}",
+    ])
+
+    return "\n".join(report_lines)
+
+
+def _employee_total(hours, salary):
+    return f"Итого по сотруднику: {hours} ч, {salary} ₽"
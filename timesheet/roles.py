@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.cache import cache
+
+MANAGERS_GROUP = 'Managers'
+
+# Роли пользователя (имена его групп) кешируются; при изменении User.groups кеш
+# сбрасывается сигналами из signals.py — но только в кеше того процесса, где
+# произошло изменение, если кеш не общий (LocMemCache). Поэтому срок короткий:
+# снятый с роли менеджер теряет права в других процессах не позже чем через него.
+# С общим кешем (Redis, Memcached) settings.ROLES_CACHE_TIMEOUT можно увеличить
+ROLES_CACHE_TIMEOUT = 60
+
+
+def _cache_key(user_id):
+    return f'timesheet:roles:{user_id}'
+
+
+def get_roles(user):
+    """Множество ролей пользователя: не больше одного запроса к БД на запрос и ни одного при попадании в кеш."""
+    if not user.is_authenticated:
+        return frozenset()
+
+    # request.user живёт ровно один запрос — запоминаем роли прямо на нём
+    roles = getattr(user, '_timesheet_roles', None)
+    if roles is None:
+        names = cache.get(_cache_key(user.pk))
+        if names is None:
+            names = sorted(user.groups.values_list('name', flat=True))
+            cache.set(_cache_key(user.pk), names, getattr(settings, 'ROLES_CACHE_TIMEOUT', ROLES_CACHE_TIMEOUT))
+        roles = frozenset(names)
+        user._timesheet_roles = roles
+    return roles
+
+
+def invalidate_roles(user_ids):
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+
+
+# Проверка на менеджера (группа Managers)
+def is_manager(user):
+    return MANAGERS_GROUP in get_roles(user)
@@ -0,0 +1,112 @@
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+
+from . import ledger, stats, versions
+from .choices import invalidate_choices
+from .models import Employee, Project, Task, Timesheet
+from .roles import invalidate_roles
+
+# Отправляется после любого изменения записей Timesheet — в том числе массового
+# (bulk_create/update), которое обходит post_save. Аргумент changes — список пар
+# (было, стало) из Timesheet.snapshot(); None означает, что записи нет.
+timesheets_changed = Signal()
+
+
+def notify_timesheets_changed(changes):
+    if changes:
+        timesheets_changed.send(sender=Timesheet, changes=changes)
+
+
+# --- Сброс кеша ролей при изменении групп пользователя ---
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        # user.groups.add(...) / remove / clear
+        invalidate_roles([instance.pk])
+    elif action == 'pre_clear':
+        # group.user_set.clear(): pk_set не передаётся, собираем участников заранее
+        invalidate_roles(instance.user_set.values_list('pk', flat=True))
+    else:
+        invalidate_roles(pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # Переименование или удаление группы меняет роли всех её участников
+    if instance.pk:
+        invalidate_roles(instance.user_set.values_list('pk', flat=True))
+
+
+# --- Сброс кеша выпадающих списков (задачи, проекты, сотрудники) ---
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+def choices_changed(sender, **kwargs):
+    invalidate_choices()
+
+
+@receiver(post_save, sender=User)
+def user_renamed(sender, update_fields=None, **kwargs):
+    # Вход пользователя сохраняет только last_login — имена в списках не меняются
+    if update_fields is None or set(update_fields) - {'last_login'}:
+        invalidate_choices()
+
+
+@receiver(m2m_changed, sender=Project.employees.through)
+def project_members_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_choices()
+
+
+# --- Производные данные по Timesheet ---
+
+@receiver(pre_save, sender=Timesheet)
+def remember_original(sender, instance, **kwargs):
+    # Объект создан вручную, а не загружен из БД — исходные значения берём из таблицы
+    if instance.pk is not None and getattr(instance, '_original', None) is None:
+        instance._original = (
+            Timesheet.objects.filter(pk=instance.pk).values(*Timesheet.SNAPSHOT_FIELDS).first()
+        )
+
+
+@receiver(post_save, sender=Timesheet)
+def timesheet_saved(sender, instance, created, **kwargs):
+    old = None if created else getattr(instance, '_original', None)
+    new = instance.snapshot()
+    instance._original = new
+    if old != new:
+        notify_timesheets_changed([(old, new)])
+
+
+@receiver(post_delete, sender=Timesheet)
+def timesheet_deleted(sender, instance, **kwargs):
+    old = getattr(instance, '_original', None) or instance.snapshot()
+    instance._original = None
+    notify_timesheets_changed([(old, None)])
+
+
+@receiver(timesheets_changed)
+def update_employee_stats(sender, changes, **kwargs):
+    stats.apply_changes(changes)
+
+
+@receiver(timesheets_changed)
+def update_weekly_ledger(sender, changes, **kwargs):
+    # Журнал недельных часов; при одобрении — проверка переработки по одной строке журнала
+    ledger.apply_changes(changes)
+
+
+
+@receiver(timesheets_changed)
+def bump_month_versions(sender, changes, **kwargs):
+    # Кеш отчётов по затронутым месяцам становится недействительным
+    versions.apply_changes(changes)
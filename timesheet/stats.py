@@ -0,0 +1,96 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from .models import EmployeeStats, Timesheet
+
+STATUS_FIELDS = {
+    'pending': 'pending_hours',
+    'approved': 'approved_hours',
+    'rejected': 'rejected_hours',
+}
+COUNTER_FIELDS = ('entry_count', 'total_hours') + tuple(STATUS_FIELDS.values())
+
+
+def _add(deltas, row, sign):
+    delta = deltas[row['employee_id']]
+    hours = Decimal(str(row['hours'])) * sign
+    delta['entry_count'] += sign
+    delta['total_hours'] += hours
+    delta[STATUS_FIELDS[row['status']]] += hours
+
+
+def apply_changes(changes):
+    """
+    Инкрементально обновить EmployeeStats.
+    changes — список пар (было, стало) из Timesheet.snapshot(); None — записи нет.
+    """
+    deltas = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+    for old, new in changes:
+        if old is not None:
+            _add(deltas, old, -1)
+        if new is not None:
+            _add(deltas, new, 1)
+
+    with transaction.atomic():
+        for employee_id, delta in deltas.items():
+            updates = {name: F(name) + value for name, value in delta.items() if value}
+            if not updates:
+                continue
+            if not EmployeeStats.objects.filter(pk=employee_id).update(**updates):
+                # Строки ещё нет — считаем её целиком по уже записанным данным
+                rebuild([employee_id])
+
+
+def compute(employee_ids=None):
+    """Итоги по сотрудникам, посчитанные по сырым Timesheet одним GROUP BY."""
+    queryset = Timesheet.objects.all()
+    if employee_ids is not None:
+        queryset = queryset.filter(employee_id__in=employee_ids)
+    rows = queryset.values('employee_id').annotate(
+        entry_count=Count('id'),
+        total_hours=Sum('hours'),
+        **{
+            field: Sum('hours', filter=Q(status=status))
+            for status, field in STATUS_FIELDS.items()
+        },
+    ).order_by()
+    return {
+        row.pop('employee_id'): {name: row[name] or 0 for name in COUNTER_FIELDS}
+        for row in rows
+    }
+
+
+def rebuild(employee_ids=None):
+    """Пересчитать EmployeeStats с нуля (для всех сотрудников или только для указанных)."""
+    computed = compute(employee_ids)
+    with transaction.atomic():
+        existing = EmployeeStats.objects.all()
+        if employee_ids is not None:
+            existing = existing.filter(pk__in=employee_ids)
+        existing.delete()
+        EmployeeStats.objects.bulk_create(
+            [EmployeeStats(employee_id=employee_id, **values) for employee_id, values in computed.items()],
+            batch_size=500,
+        )
+    return len(computed)
+
+
+def find_drift():
+    """Сотрудники, у которых сохранённые итоги расходятся с сырыми данными: {id: (сохранено, должно быть)}."""
+    computed = compute()
+    stored = {
+        row.pop('employee_id'): row
+        for row in EmployeeStats.objects.values('employee_id', *COUNTER_FIELDS)
+    }
+    empty = dict.fromkeys(COUNTER_FIELDS, 0)
+    drift = {}
+    for employee_id in computed.keys() | stored.keys():
+        expected = computed.get(employee_id, empty)
+        actual = stored.get(employee_id, empty)
+        # Сотрудник без записей может иметь нулевую строку — это не расхождение
+        if any(Decimal(actual[name]) != Decimal(expected[name]) for name in COUNTER_FIELDS):
+            drift[employee_id] = (actual, expected)
+    return drift
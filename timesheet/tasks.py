@@ -0,0 +1,53 @@
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage
+
+from .exports import purge_expired, run_export
+from .jobs import handler
+from .ledger import WEEKLY_NORM
+from .models import Employee
+from .reports import build_report_text
+
+
+@handler('report_email')
+def report_email(user_id):
+    user = User.objects.get(pk=user_id)
+    return [EmailMessage(
+        subject='Отчёт по таймшиту',
+        body=build_report_text(),
+        from_email=None,  # использует DEFAULT_FROM_EMAIL
+        to=[user.email],  # на email менеджера
+        reply_to=[user.email],
+    )]
+
+
+@handler('overtime_email')
+def overtime_email(employee_id, week_start, total_hours):
+    user = Employee.objects.select_related('user').get(pk=employee_id).user
+    start_week = date.fromisoformat(week_start)
+    end_week = start_week + timedelta(days=6)
+    overtime = float(total_hours) - WEEKLY_NORM
+    message = f"""
+Уважаемый(ая) {user.get_full_name() or user.username},
+
+За неделю {start_week.strftime('%d.%m.%Y')} — {end_week.strftime('%d.%m.%Y')}
+у вас зафиксировано {total_hours} часов (норма {WEEKLY_NORM} ч).
+
+Переработка: {overtime:g} ч.
+
+С уважением,
+Система Timesheet
+    """
+    return [EmailMessage(
+        subject='Переработка зафиксирована!',
+        body=message,
+        from_email='timesheet@company.com',
+        to=[user.email] if user.email else ['test@example.com'],
+    )]
+
+
+@handler('export_excel', atomic=False)
+def export_excel(export_id):
+    purge_expired()
+    run_export(export_id)
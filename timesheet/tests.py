@@ -1,3 +1,1279 @@
-from django.test import TestCase
+import json
+import logging
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Q
+from django.http import Http404, HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook, load_workbook
+
+from . import export_cache, jobs, ledger, stats
+from .approval import change_status
+from .exports import HEADERS, CsvWriter, ExportWriter, StreamingExportWriter, XlsxWriter, export_pipeline
+from .rates import rate_on, set_rate
+from .reports import build_report_text
+from .forms import TimesheetFilterForm, TimesheetForm
+from .models import Employee, EmployeeStats, ExportJob, Job, Project, Task, Timesheet, WeeklyHours
+from .pagination import paginate_keyset
+from .querycount import QueryBudgetExceeded, query_budget
+from .roles import is_manager
+
+
+# В тестах превышение бюджета запросов (@query_budget) — ошибка, а не предупреждение
+@override_settings(QUERY_BUDGET_STRICT=True)
+class TimesheetTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', password='pass')
+        cls.manager.groups.add(Group.objects.create(name='Managers'))
+        cls.user = User.objects.create_user('worker', password='pass')
+        cls.employee = Employee.objects.create(user=cls.user, hourly_rate=20)
+        cls.project = Project.objects.create(name='Проект')
+        cls.project.employees.add(cls.employee)
+        cls.task = Task.objects.create(name='Задача', project=cls.project)
+
+    def setUp(self):
+        # Кеш (роли и т.п.) переживает откат транзакции теста — чистим его
+        cache.clear()
+        # Файлы выгрузок — во временный каталог
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        export_dirs = override_settings(EXPORT_ROOT=tmp.name, EXPORT_CACHE_ROOT=os.path.join(tmp.name, 'cache'))
+        export_dirs.enable()
+        self.addCleanup(export_dirs.disable)
+
+    def add_timesheets(self, count, start=date(2025, 1, 6), **kwargs):
+        kwargs.setdefault('hours', 8)
+        kwargs.setdefault('task', self.task)
+        return [
+            Timesheet.objects.create(employee=self.employee, date=start + timedelta(days=i), **kwargs)
+            for i in range(count)
+        ]
+
+
+class QueryCountTests(TimesheetTestCase):
+    def count_queries(self, user, url):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx)
+
+    def test_list_queries_do_not_grow_with_rows(self):
+        url = reverse('timesheet_list')
+        self.add_timesheets(1)
+        for user in (self.manager, self.user):
+            self.count_queries(user, url)  # прогрев кеша ролей
+            few = self.count_queries(user, url)
+            self.add_timesheets(20, start=date(2024, 1, 1))
+            self.assertEqual(self.count_queries(user, url), few)
+
+    def test_budget_is_strict_only_when_configured(self):
+        @query_budget(0)
+        def view(request):
+            User.objects.exists()
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        with self.assertRaises(QueryBudgetExceeded):
+            view(request)
+        with override_settings(QUERY_BUDGET_STRICT=False), self.assertLogs('timesheet.querycount', 'WARNING'):
+            self.assertEqual(view(request).status_code, 200)
+
+    # Число запросов проверяется напрямую: исключение @query_budget зависит
+    # от QUERY_BUDGET_STRICT. Сессия, пользователь и один запрос самой view
+    @override_settings(QUERY_BUDGET_STRICT=False)
+    def test_approve_form_queries(self):
+        ts = self.add_timesheets(1)[0]
+        url = reverse('timesheet_approve', args=[ts.pk])
+        self.count_queries(self.manager, url)  # прогрев кеша ролей
+        self.assertEqual(self.count_queries(self.manager, url), 3)
+
+    @override_settings(QUERY_BUDGET_STRICT=False)
+    def test_home_queries(self):
+        self.add_timesheets(5)
+        url = reverse('home')
+        self.count_queries(self.user, url)
+        few = self.count_queries(self.user, url)
+        self.assertEqual(few, 3)
+        self.add_timesheets(20, start=date(2024, 1, 1))
+        self.assertEqual(self.count_queries(self.user, url), few)
+
+
+class ListFilterTests(TimesheetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_task = Task.objects.create(name='Другая', project=Project.objects.create(name='Другой'))
+        self.add_timesheets(5)
+        self.add_timesheets(3, start=date(2025, 2, 3), status='approved')
+        self.add_timesheets(2, start=date(2025, 3, 3), task=self.other_task)
+
+    def get_list(self, user, params):
+        self.client.force_login(user)
+        response = self.client.get(reverse('timesheet_list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_filters_are_combined(self):
+        response = self.get_list(self.manager, {
+            'employee': self.employee.pk, 'status': 'pending', 'date_from': '2025-01-07', 'date_to': '2025-01-31',
+        })
+        self.assertEqual([ts.date.day for ts in response.context['timesheets']], [10, 9, 8, 7])
+
+        response = self.get_list(self.manager, {'project': self.other_task.project_id})
+        self.assertEqual({ts.task_id for ts in response.context['timesheets']}, {self.other_task.pk})
+
+    def test_invalid_values_are_ignored(self):
+        response = self.get_list(self.user, {'status': 'lost', 'date_from': 'вчера', 'task': self.task.pk})
+        self.assertEqual(len(response.context['timesheets']), 8)
+        # Сотруднику фильтр по сотрудникам не нужен
+        self.assertNotIn('employee', response.context['filter_form'].fields)
+
+    def test_filters_are_kept_in_cursor(self):
+        response = self.get_list(self.manager, {'status': 'pending', 'page_size': 4})
+        page = response.context['page']
+        self.assertEqual(page.next_query.count('status'), 0)
+
+        # Вторая страница — только по курсору, без параметров фильтра в ссылке
+        response = self.client.get(reverse('timesheet_list') + page.next_query)
+        self.assertEqual([ts.status for ts in response.context['timesheets']], ['pending'] * 3)
+        self.assertEqual(response.context['filter_form']['status'].value(), 'pending')
+
+    def test_dropdowns_are_cached(self):
+        self.get_list(self.manager, {'project': self.project.pk})
+        form = TimesheetFilterForm({'project': self.project.pk})
+        with self.assertNumQueries(0):
+            TimesheetFilterForm({'project': self.project.pk}).fields['task'].choices
+        self.assertEqual([label for _, label in form.fields['task'].choices], ['Все задачи', 'Задача (Проект)'])
+
+
+class RolesTests(TimesheetTestCase):
+    def fresh(self, user):
+        return User.objects.get(pk=user.pk)
+
+    def test_roles_are_cached_between_requests(self):
+        self.assertTrue(is_manager(self.fresh(self.manager)))
+        user = self.fresh(self.manager)
+        with self.assertNumQueries(0):
+            self.assertTrue(is_manager(user))
+
+    @override_settings(ROLES_CACHE_TIMEOUT=0)
+    def test_cache_timeout_comes_from_settings(self):
+        # Кеш в памяти процесса не видит сбросов из других воркеров — срок должен работать сам
+        self.assertTrue(is_manager(self.fresh(self.manager)))
+        user = self.fresh(self.manager)
+        with self.assertNumQueries(1):
+            self.assertTrue(is_manager(user))
+
+    def test_group_changes_invalidate_cache(self):
+        self.assertFalse(is_manager(self.fresh(self.user)))
+        group = Group.objects.get(name='Managers')
+        group.user_set.add(self.user)
+        self.assertTrue(is_manager(self.fresh(self.user)))
+        self.user.groups.remove(group)
+        self.assertFalse(is_manager(self.fresh(self.user)))
+        self.user.groups.add(group)
+        self.assertTrue(is_manager(self.fresh(self.user)))
+        group.user_set.clear()
+        self.assertFalse(is_manager(self.fresh(self.user)))
+
+
+class EmployeeStatsTests(TimesheetTestCase):
+    def test_stats_follow_timesheet_changes(self):
+        first, second = self.add_timesheets(2)
+        second.status = 'approved'
+        second.hours = 6
+        second.save()
+        first.delete()
+        Timesheet.objects.get(pk=second.pk).save()  # сохранение без изменений
+
+        employee_stats = EmployeeStats.objects.get(employee=self.employee)
+        self.assertEqual(employee_stats.entry_count, 1)
+        self.assertEqual(employee_stats.total_hours, 6)
+        self.assertEqual(employee_stats.approved_hours, 6)
+        self.assertEqual(employee_stats.pending_hours, 0)
+        self.assertEqual(stats.find_drift(), {})
+
+    def test_check_command_reports_drift(self):
+        self.add_timesheets(3)
+        EmployeeStats.objects.update(total_hours=1)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_employee_stats', '--check', stdout=StringIO())
+        call_command('rebuild_employee_stats', stdout=StringIO())
+        self.assertEqual(EmployeeStats.objects.get().total_hours, 24)
+
+
+class ExportTests(TimesheetTestCase):
+    def test_export_excel(self):
+        self.add_timesheets(3, status='approved')
+        self.add_timesheets(1, start=date(2025, 2, 1))
+        self.client.force_login(self.manager)
+        response = self.client.get(reverse('export_excel'), {'month': '2025-01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('timesheet_2025-01.xlsx', response['Content-Disposition'])
+
+        workbook = load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+        rows = list(workbook.active.values)
+        self.assertEqual(len(rows), 1 + 3 + 2)
+        self.assertEqual(rows[1][:5], ('worker', 'Проект', 'Задача', '06.01.2025', 8))
+        self.assertEqual(rows[-1][-1], 480)
+
+    def test_streaming_formats(self):
+        self.add_timesheets(2, status='approved')
+        self.add_timesheets(1, start=date(2025, 2, 1), status='approved')
+        self.client.force_login(self.manager)
+
+        response = self.client.get(reverse('export_excel'), {'month': '2025-01', 'format': 'csv'})
+        self.assertIn('timesheet_2025-01.csv', response['Content-Disposition'])
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(lines[0].split(','), HEADERS)
+        self.assertEqual(lines[1:], ['worker,Проект,Задача,2025-01-06,8.00,20.00,160.00', 'worker,Проект,Задача,2025-01-07,8.00,20.00,160.00'])
+
+        response = self.client.get(reverse('export_excel'), {'format': 'jsonl'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0], {
+            'employee': 'worker', 'project': 'Проект', 'task': 'Задача', 'date': '2025-01-06',
+            'hours': '8.00', 'rate': '20.00', 'salary': '160.00',
+        })
+
+    def test_report_text_keeps_namesakes_apart(self):
+        namesake = Employee.objects.create(
+            user=User.objects.create_user('worker2', first_name='Иван', last_name='Петров'), hourly_rate=30,
+        )
+        User.objects.filter(pk=self.user.pk).update(first_name='Иван', last_name='Петров')
+        self.add_timesheets(2, status='approved')
+        Timesheet.objects.create(employee=namesake, task=self.task, date=date(2025, 1, 6), hours=1, status='approved')
+
+        text = build_report_text()
+        self.assertEqual(text.count('Сотрудник: Иван Петров'), 2)
+        self.assertIn('Итого по сотруднику: 16.00 ч, 320.00 ₽', text)
+        self.assertIn('Итого по сотруднику: 1.00 ч, 30.00 ₽', text)
+
+    def test_writer_interfaces(self):
+        # Книга Excel собирается только в файл — потокового chunks() у неё нет
+        self.assertFalse(hasattr(XlsxWriter(), 'chunks'))
+        self.assertTrue(issubclass(CsvWriter, StreamingExportWriter))
+        with self.assertRaises(TypeError):
+            ExportWriter()
+
+    def test_format_is_validated_and_part_of_etag(self):
+        self.client.force_login(self.manager)
+        self.assertEqual(self.client.get(reverse('export_excel'), {'format': 'pdf'}).status_code, 400)
+        etag = self.client.get(reverse('export_excel'), {'format': 'csv'})['ETag']
+        self.assertNotEqual(self.client.get(reverse('export_excel'), {'format': 'jsonl'})['ETag'], etag)
+
+    def test_pipeline_totals_and_progress(self):
+        self.add_timesheets(5, status='approved')
+        seen = []
+        rows, totals = export_pipeline(Timesheet.objects.all(), progress=seen.append)
+        totals.step = 2
+        self.assertEqual(len(list(rows)), 5)
+        self.assertEqual((totals.rows, totals.hours, totals.salary), (5, 40, 800))
+        self.assertEqual(seen, [2, 4, 5])
+
+
+
+class ExportCacheTests(TimesheetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.entries = self.add_timesheets(3, status='approved')
+        self.client.force_login(self.manager)
+
+    def cached_files(self):
+        return sorted(path.name for path in export_cache.cache_root().glob('*.xlsx'))
+
+    def export(self, month='2025-01'):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('export_excel'), {'month': month})
+            content = b''.join(response.streaming_content)
+        built = any('ORDER BY "timesheet_timesheet"."date" ASC' in q['sql'] for q in ctx.captured_queries)
+        return content, built
+
+    def test_closed_month_is_served_from_cache(self):
+        content, built = self.export()
+        self.assertTrue(built)
+        self.assertEqual(len(self.cached_files()), 1)
+        cached, built = self.export()
+        self.assertFalse(built)
+        self.assertEqual(cached, content)
+
+        # Любое изменение данных месяца — новый отпечаток и новая книга
+        self.entries[0].hours = 4
+        self.entries[0].save()
+        content, built = self.export()
+        self.assertTrue(built)
+        self.assertEqual(len(self.cached_files()), 2)
+        self.assertEqual(list(load_workbook(BytesIO(content), read_only=True).active.values)[1][4], 4)
+
+    def test_renaming_changes_fingerprint(self):
+        timesheets = Timesheet.objects.filter(status='approved')
+        before = export_cache.month_fingerprint(timesheets, date(2025, 1, 1))
+        self.project.name = 'Другой проект'
+        self.project.save()
+        self.assertNotEqual(export_cache.month_fingerprint(timesheets, date(2025, 1, 1)), before)
+
+    def test_current_month_is_not_cached(self):
+        self.add_timesheets(1, start=timezone.localdate(), status='approved')
+        _, built = self.export(timezone.localdate().strftime('%Y-%m'))
+        self.assertTrue(built)
+        self.assertEqual(self.cached_files(), [])
+
+    def test_least_recently_used_are_evicted(self):
+        root = export_cache.cache_root()
+        root.mkdir(parents=True)
+        for age, name in enumerate(['new', 'middle', 'old']):
+            path = root / f'{name}.xlsx'
+            path.write_bytes(b'x' * 100)
+            os.utime(path, (1000 - age, 1000 - age))
+        # Обращение к самому старому делает его самым свежим
+        with export_cache.cached_workbook('old', None):
+            pass
+        self.assertEqual(export_cache.evict(max_bytes=250), 1)
+        self.assertEqual(self.cached_files(), ['new.xlsx', 'old.xlsx'])
+
+        with override_settings(EXPORT_CACHE_MAX_BYTES=0):
+            self.export()
+        self.assertEqual(len(self.cached_files()), 1)
+
+class ExportJobTests(TimesheetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_timesheets(3, status='approved')
+        self.client.force_login(self.manager)
+
+    def start(self, **data):
+        response = self.client.post(reverse('export_job_start'), data)
+        export = ExportJob.objects.order_by('-id').first()
+        self.assertRedirects(response, reverse('export_job', args=[export.pk]), fetch_redirect_response=False)
+        return export
+
+    def test_job_builds_file_with_progress(self):
+        export = self.start()
+        self.assertEqual(export.status, 'queued')
+        status = self.client.get(reverse('export_job_status', args=[export.pk])).json()
+        self.assertIsNone(status['download'])
+        self.assertEqual(self.client.get(reverse('export_job_download', args=[export.pk])).status_code, 404)
+
+        self.assertEqual(jobs.run_pending(), 1)
+        status = self.client.get(reverse('export_job_status', args=[export.pk])).json()
+        self.assertEqual((status['status'], status['rows_done'], status['rows_total']), ('done', 3, 3))
+
+        response = self.client.get(status['download'])
+        self.assertIn('timesheet_full_', response['Content-Disposition'])
+        workbook = load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+        self.assertEqual(len(list(workbook.active.values)), 1 + 3 + 2)
+        self.assertContains(self.client.get(reverse('export_job', args=[export.pk])), 'Скачать файл')
+
+    def test_same_data_version_reuses_file(self):
+        export = self.start(month='2025-01')
+        jobs.run_pending()
+        self.assertEqual(self.start(month='2025-01'), export)
+        self.assertEqual(Job.objects.count(), 1)
+
+        # Другой месяц и изменение данных — новая выгрузка
+        self.assertNotEqual(self.start(month='2025-02'), export)
+        self.add_timesheets(1, start=date(2025, 1, 20), status='approved')
+        rebuilt = self.start(month='2025-01')
+        self.assertNotEqual(rebuilt, export)
+        jobs.run_pending()
+        rebuilt.refresh_from_db()
+        self.assertEqual(rebuilt.rows_total, 4)
+
+        # Удалённый файл собирается заново
+        rebuilt.path.unlink()
+        self.assertNotEqual(self.start(month='2025-01'), rebuilt)
+
+    def test_export_of_dead_worker_does_not_block_new_one(self):
+        export = self.start()
+        [job] = jobs.claim_jobs(1)
+        self.assertEqual(job, export.job)
+        ExportJob.objects.filter(pk=export.pk).update(status='running')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1), attempts=job.max_attempts - 1)
+        jobs.requeue_stale()
+
+        status = self.client.get(reverse('export_job_status', args=[export.pk])).json()
+        self.assertEqual(status['status'], 'failed')
+        self.assertNotEqual(self.start(), export)
+
+    def test_stale_export_is_rebuilt_by_next_worker(self):
+        export = self.start()
+        jobs.claim_jobs(1)
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.run_pending(), 1)
+        export.refresh_from_db()
+        self.assertEqual((export.status, export.rows_done), ('done', 3))
+
+    def test_expired_exports_are_purged(self):
+        export = self.start()
+        jobs.run_pending()
+        export.refresh_from_db()
+        ExportJob.objects.filter(pk=export.pk).update(created_at=timezone.now() - timedelta(days=2))
+        self.start()
+        jobs.run_pending()
+        self.assertFalse(ExportJob.objects.filter(pk=export.pk).exists())
+        self.assertFalse(export.path.exists())
+
+    def test_only_managers(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('export_job_start'))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(ExportJob.objects.exists())
+
+class ReportTests(TimesheetTestCase):
+    def test_report_totals_are_computed_in_sql(self):
+        other_user = User.objects.create_user('other')
+        other = Employee.objects.create(user=other_user, hourly_rate=Decimal('12.50'))
+        self.add_timesheets(3, status='approved', hours=Decimal('7.5'))
+        Timesheet.objects.create(employee=other, task=self.task, date=date(2025, 1, 10), hours=2, status='approved')
+        self.add_timesheets(1, status='pending')
+        self.add_timesheets(1, start=date(2025, 2, 3), status='approved')
+
+        self.client.force_login(self.manager)
+        self.client.get(reverse('report'), {'month': '2025-01'})  # прогрев кеша ролей
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('report'), {'month': '2025-01'})
+        self.assertEqual(response.context['total_hours'], Decimal('24.5'))
+        self.assertEqual(response.context['total_salary'], Decimal('475.00'))
+        self.assertEqual(
+            [(row['name'], row['salary']) for row in response.context['by_employee']],
+            [('other', Decimal('25.00')), ('worker', Decimal('450.00'))],
+        )
+        self.assertEqual(len(response.context['timesheets']), 4)
+
+    def test_employee_sees_only_own_rows(self):
+        self.add_timesheets(2, status='approved')
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('report'), {'month': '2025-01'})
+        self.assertEqual(response.context['total_salary'], Decimal('320.00'))
+
+
+    def report_queries(self, user, month):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('report'), {'month': month})
+        return response, sum('GROUP BY' in q['sql'] for q in ctx.captured_queries)
+
+    def test_summary_is_cached_per_month_version(self):
+        entries = self.add_timesheets(2, status='approved')
+        self.assertEqual(self.report_queries(self.manager, '2025-01')[1], 1)
+        response, aggregates = self.report_queries(self.manager, '2025-01')
+        self.assertEqual((aggregates, response.context['total_hours']), (0, 16))
+
+        # Изменение другого месяца не сбрасывает кеш января
+        self.add_timesheets(1, start=date(2025, 2, 3), status='approved')
+        self.assertEqual(self.report_queries(self.manager, '2025-01')[1], 0)
+
+        entries[0].status = 'rejected'
+        entries[0].save()
+        response, aggregates = self.report_queries(self.manager, '2025-01')
+        self.assertEqual((aggregates, response.context['total_hours']), (1, 8))
+
+        # У сотрудника своя область кеша
+        response, aggregates = self.report_queries(self.user, '2025-01')
+        self.assertEqual((aggregates, response.context['total_hours']), (1, 8))
+        self.assertEqual(self.report_queries(self.user, '2025-01')[1], 0)
+
+    def test_rename_refreshes_cached_summary(self):
+        self.add_timesheets(1, status='approved')
+        self.report_queries(self.manager, '2025-01')
+        self.project.name = 'Новый проект'
+        self.project.save()
+        self.user.first_name = 'Иван'
+        self.user.save()
+
+        response, aggregates = self.report_queries(self.manager, '2025-01')
+        self.assertEqual(aggregates, 1)
+        self.assertEqual([p['name'] for p in response.context['by_project']], ['Новый проект'])
+        self.assertEqual([e['name'] for e in response.context['by_employee']], ['Иван'])
+
+
+class SalarySnapshotTests(TimesheetTestCase):
+    def test_rate_is_fixed_at_approval(self):
+        entry = self.add_timesheets(1, hours=Decimal('7.5'))[0]
+        self.assertIsNone(entry.salary_amount)
+        entry.status = 'approved'
+        entry.save()
+        Employee.objects.filter(pk=self.employee.pk).update(hourly_rate=30)
+
+        entry.refresh_from_db()
+        self.assertEqual((entry.rate_at_approval, entry.salary_amount), (20, Decimal('150.00')))
+        entry.hours = 4
+        entry.save()
+        self.assertEqual(Timesheet.objects.get(pk=entry.pk).salary_amount, Decimal('80.00'))
+
+        entry.status = 'rejected'
+        entry.save()
+        self.assertIsNone(Timesheet.objects.get(pk=entry.pk).rate_at_approval)
+
+    def test_bulk_approval_and_backfill(self):
+        entries = self.add_timesheets(3, hours=Decimal('2.5'))
+        change_status([entries[0].pk], 'approved')
+        Timesheet.objects.filter(pk=entries[1].pk).update(status='approved')  # как до миграции
+        Employee.objects.filter(pk=self.employee.pk).update(hourly_rate=Decimal('10.10'))
+
+        out = StringIO()
+        call_command('backfill_salary', batch_size=1, stdout=out)
+        self.assertIn('Заполнено записей: 1', out.getvalue())
+        self.assertEqual(
+            list(Timesheet.objects.order_by('pk').values_list('rate_at_approval', 'salary_amount')),
+            [(20, Decimal('50.00')), (Decimal('10.10'), Decimal('25.25')), (None, None)],
+        )
+
+    def test_migration_backfills_rows_approved_before_snapshot(self):
+        migration = import_module('timesheet.migrations.0013_backfill_salary_snapshot')
+        set_rate(self.employee, 30, date(2025, 1, 7))
+        entries = self.add_timesheets(3, hours=2)
+        Timesheet.objects.filter(pk__in=[ts.pk for ts in entries[:2]]).update(status='approved')
+
+        migration.backfill_salary_snapshot(apps, None)
+        # Ставка на дату записи, а не текущая; неодобренные не трогаются
+        self.assertEqual(
+            list(Timesheet.objects.order_by('date').values_list('rate_at_approval', 'salary_amount')),
+            [(20, Decimal('40.00')), (30, Decimal('60.00')), (None, None)],
+        )
+
+    def test_missing_snapshot_does_not_break_reports(self):
+        self.add_timesheets(2, status='approved')
+        Timesheet.objects.update(rate_at_approval=None, salary_amount=None)
+        self.client.force_login(self.manager)
+
+        response = self.client.get(reverse('report'), {'month': '2025-01'})
+        self.assertEqual((response.status_code, response.context['total_salary']), (200, 0))
+        response = self.client.get(reverse('export_excel'), {'month': '2025-01'})
+        self.assertEqual(response.status_code, 200)
+        b''.join(response.streaming_content)
+        response = self.client.get(reverse('export_excel'), {'month': '2025-01', 'format': 'csv'})
+        self.assertIn(',8.00,0,0.00', b''.join(response.streaming_content).decode('utf-8-sig'))
+
+
+class RateHistoryTests(TimesheetTestCase):
+    def test_set_rate_splits_history(self):
+        set_rate(self.employee, 25, date(2025, 1, 8))
+        set_rate(self.employee, 22, date(2025, 1, 7))  # задним числом, внутрь истории
+        self.assertEqual(
+            list(self.employee.rates.values_list('hourly_rate', 'valid_from', 'valid_to')),
+            [
+                (20, date(2000, 1, 1), date(2025, 1, 7)),
+                (22, date(2025, 1, 7), date(2025, 1, 8)),
+                (25, date(2025, 1, 8), None),
+            ],
+        )
+        self.assertEqual(Employee.objects.get(pk=self.employee.pk).hourly_rate, 25)
+        self.assertEqual(rate_on(self.employee.pk, date(2025, 1, 7)), 22)
+
+    def test_salary_uses_rate_on_entry_date(self):
+        set_rate(self.employee, 30, date(2025, 1, 8))
+        entries = self.add_timesheets(4, hours=2)
+        change_status([ts.pk for ts in entries[:3]], 'approved')
+        entries[3].status = 'approved'
+        entries[3].save()
+        self.assertEqual(
+            list(Timesheet.objects.order_by('date').values_list('salary_amount', flat=True)),
+            [40, 40, 60, 60],
+        )
+
+        # Исправили историю — пересчёт снимков по новым ставкам
+        set_rate(self.employee, 10, date(2025, 1, 6))
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('backfill_salary', recompute=True, batch_size=3, stdout=StringIO())
+        # Один UPDATE с подзапросом на порцию, а не запрос на запись
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "timesheet_timesheet"')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(
+            list(Timesheet.objects.order_by('date').values_list('salary_amount', flat=True)),
+            [20, 20, 60, 60],
+        )
+
+
+class JobQueueTests(TimesheetTestCase):
+    def test_report_email_is_sent_by_worker(self):
+        self.manager.email = 'manager@example.com'
+        self.manager.save()
+        self.add_timesheets(2, status='approved')
+        self.client.force_login(self.manager)
+        response = self.client.get(reverse('send_report_email'))
+        self.assertRedirects(response, reverse('timesheet_list'), fetch_redirect_response=False)
+        self.assertEqual(len(mail.outbox), 0)
+
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['manager@example.com'])
+        self.assertIn('ИТОГО ЧАСОВ: 16.0', mail.outbox[0].body)
+        self.assertEqual(Job.objects.get().status, 'done')
+
+    def test_failed_job_is_retried_with_backoff(self):
+        job = jobs.enqueue('report_email', user_id=0)
+        with self.assertLogs('timesheet.jobs', 'ERROR'):
+            self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(jobs.run_pending(), 0)
+
+        Job.objects.update(run_after=timezone.now(), attempts=job.max_attempts - 1)
+        with self.assertLogs('timesheet.jobs', 'ERROR'):
+            jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('DoesNotExist', job.last_error)
+
+    def claim_and_abandon(self):
+        # Воркер взял задачу и упал: задача осталась 'running'
+        [job] = jobs.claim_jobs(1)
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        return job
+
+    def test_stale_running_job_is_requeued(self):
+        self.manager.email = 'manager@example.com'
+        self.manager.save()
+        job = jobs.enqueue('report_email', user_id=self.manager.pk)
+        self.claim_and_abandon()
+        self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('done', 2))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_fresh_lease_is_not_taken_over(self):
+        jobs.enqueue('report_email', user_id=self.manager.pk)
+        jobs.claim_jobs(1)
+        self.assertEqual(jobs.requeue_stale(), 0)
+        self.assertEqual(jobs.run_pending(), 0)
+
+    def test_stale_job_without_attempts_left_fails(self):
+        job = jobs.enqueue('report_email', user_id=self.manager.pk)
+        Job.objects.filter(pk=job.pk).update(attempts=job.max_attempts - 1)
+        self.claim_and_abandon()
+        self.assertEqual(jobs.requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('аренды', job.last_error)
+
+    def test_expired_claim_is_not_run_twice(self):
+        jobs.enqueue('report_email', user_id=self.manager.pk)
+        [job] = jobs.claim_jobs(1)
+        # Аренду перехватил другой воркер — эта копия задачу не выполняет
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() + timedelta(seconds=1))
+        self.assertFalse(jobs._renew(job))
+        self.assertTrue(jobs._renew(Job.objects.get(pk=job.pk)))
+
+
+class WeeklyLedgerTests(TimesheetTestCase):
+    def hours(self, week_start):
+        return WeeklyHours.objects.get(employee=self.employee, week_start=week_start).approved_hours
+
+    def test_ledger_follows_status_changes(self):
+        entries = self.add_timesheets(6, hours=9)  # пн 06.01 — сб 11.01
+        for ts in entries[:4]:
+            ts.status = 'approved'
+            ts.save()
+        self.assertEqual(self.hours(date(2025, 1, 6)), 36)
+        self.assertEqual(Job.objects.count(), 0)
+
+        entries[4].status = 'approved'
+        entries[4].save()
+        self.assertEqual(self.hours(date(2025, 1, 6)), 45)
+        job = Job.objects.get(kind='overtime_email')
+        self.assertEqual(job.payload['total_hours'], '45.00')
+
+        entries[0].status = 'rejected'
+        entries[0].save()
+        entries[1].date = date(2025, 1, 13)
+        entries[1].save()
+        entries[2].delete()
+        self.assertEqual(self.hours(date(2025, 1, 6)), 18)
+        self.assertEqual(self.hours(date(2025, 1, 13)), 9)
+        self.assertEqual(ledger.find_drift(), {})
+
+    def test_check_command(self):
+        self.add_timesheets(2, status='approved')
+        WeeklyHours.objects.all().delete()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_weekly_ledger', '--check', stdout=StringIO())
+        call_command('rebuild_weekly_ledger', stdout=StringIO())
+        self.assertEqual(self.hours(date(2025, 1, 6)), 16)
+
+
+class KeysetPaginationTests(TimesheetTestCase):
+    def setUp(self):
+        super().setUp()
+        # По три записи на день — курсор должен различать их по id
+        self.entries = [
+            Timesheet.objects.create(employee=self.employee, task=self.task, date=date(2025, 1, 6 + day), hours=1)
+            for day in (0, 3, 1, 2) for _ in range(3)
+        ]
+        self.expected = [entry.pk for entry in sorted(self.entries, key=lambda e: (e.date, e.pk), reverse=True)]
+
+    def page(self, **params):
+        return paginate_keyset(Timesheet.objects.all(), {'page_size': 5, **params})
+
+    def test_next_and_previous_pages_with_ties(self):
+        pages = []
+        page = self.page()
+        self.assertFalse(page.has_previous)
+        while True:
+            pages.append(page)
+            if not page.has_next:
+                break
+            page = self.page(after=page.next_cursor)
+        self.assertEqual([obj.pk for p in pages for obj in p.object_list], self.expected)
+        self.assertEqual([len(p.object_list) for p in pages], [5, 5, 2])
+
+        # Назад с последней страницы — те же строки в том же порядке
+        back = self.page(before=pages[-1].prev_cursor)
+        self.assertEqual([obj.pk for obj in back.object_list], [obj.pk for obj in pages[1].object_list])
+        self.assertTrue(back.has_previous)
+        first = self.page(before=back.prev_cursor)
+        self.assertEqual([obj.pk for obj in first.object_list], self.expected[:5])
+        self.assertFalse(first.has_previous)
+
+    def test_every_page_is_one_query(self):
+        cursor = self.page().next_cursor
+        with self.assertNumQueries(1):
+            self.page(after=cursor)
+        with self.assertNumQueries(1):
+            self.page(before=cursor)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(Http404):
+            self.page(after='not-a-cursor')
+
+class IndexUsageTests(TimesheetTestCase):
+    """EXPLAIN QUERY PLAN на SQLite: горячие запросы должны идти по индексам, а не сканировать таблицу."""
+
+    def setUp(self):
+        super().setUp()
+        self.add_timesheets(60, status='approved')
+        self.add_timesheets(5, start=date(2025, 6, 2))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index_name}', plan)
+        self.assertNotIn('SCAN timesheet_timesheet', plan)
+
+    def test_employee_list(self):
+        queryset = Timesheet.objects.filter(employee__user=self.user).order_by('-date', '-id')[:50]
+        self.assertUsesIndex(queryset, 'timesheet_employee_date_idx')
+
+    def test_approved_month(self):
+        queryset = Timesheet.objects.filter(status='approved', date__range=(date(2025, 1, 1), date(2025, 1, 31)))
+        self.assertUsesIndex(queryset, 'timesheet_status_date_idx')
+
+    def test_task_filter(self):
+        queryset = Timesheet.objects.filter(task=self.task).order_by('-date', '-id')[:50]
+        self.assertUsesIndex(queryset, 'timesheet_task_date_idx')
+
+    def test_manager_list_pages(self):
+        queryset = Timesheet.objects.select_related('employee__user', 'task__project')
+        first = queryset.order_by('-date', '-id')[:50]
+        after = queryset.filter(Q(date__lt=date(2025, 2, 1)) | Q(pk__lt=30), date__lte=date(2025, 2, 1))
+        before = queryset.filter(Q(date__gt=date(2025, 2, 1)) | Q(pk__gt=30), date__gte=date(2025, 2, 1))
+        for page in (first, after.order_by('-date', '-id')[:50], before.order_by('date', 'id')[:50]):
+            plan = page.explain()
+            self.assertIn('USING INDEX timesheet_date_id_idx', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_pending_week_of_employee(self):
+        queryset = Timesheet.objects.filter(
+            employee=self.employee, status='pending', date__range=(date(2025, 6, 2), date(2025, 6, 8)),
+        )
+        self.assertUsesIndex(queryset, 'timesheet_pending_emp_date_idx')
+
+
+class BulkApproveTests(TimesheetTestCase):
+    def test_bulk_approve_updates_only_pending_rows(self):
+        entries = self.add_timesheets(6)  # 45+ часов за неделю после одобрения
+        rejected = self.add_timesheets(1, start=date(2025, 1, 13), status='rejected')[0]
+        self.client.force_login(self.manager)
+        url = reverse('timesheet_bulk_approve')
+        ids = [ts.pk for ts in entries] + [rejected.pk]
+
+        response = self.client.post(url, {'ids': ids, 'action': 'approve'})
+        self.assertRedirects(response, reverse('timesheet_list'), fetch_redirect_response=False)
+        self.assertEqual(Timesheet.objects.filter(status='approved').count(), 6)
+        self.assertEqual(Timesheet.objects.get(pk=rejected.pk).status, 'rejected')
+
+        # Производные данные — одной пачкой: одно письмо на сотрудник-неделю
+        self.assertEqual(Job.objects.filter(kind='overtime_email').count(), 1)
+        self.assertEqual(WeeklyHours.objects.get().approved_hours, 48)
+        self.assertEqual(EmployeeStats.objects.get().approved_hours, 48)
+
+        # Повторная отправка ничего не меняет — UPDATE только по pending
+        with self.assertNumQueries(5):
+            self.client.post(url, {'ids': ids, 'action': 'reject'})
+        self.assertEqual(Timesheet.objects.filter(status='approved').count(), 6)
+
+    def test_employee_cannot_bulk_approve(self):
+        entry = self.add_timesheets(1)[0]
+        self.client.force_login(self.user)
+        self.client.post(reverse('timesheet_bulk_approve'), {'ids': [entry.pk], 'action': 'approve'})
+        self.assertEqual(Timesheet.objects.get(pk=entry.pk).status, 'pending')
+
+
+class WeekGridTests(TimesheetTestCase):
+    url = '/timesheet/week/?week=2025-01-08'
+
+    def post_grid(self, rows):
+        data = {'form-TOTAL_FORMS': len(rows), 'form-INITIAL_FORMS': len(rows)}
+        for index, (task, values) in enumerate(rows):
+            data[f'form-{index}-task'] = task.pk
+            for day, value in enumerate(values):
+                data[f'form-{index}-day_{day}'] = value
+        return self.client.post(self.url, data)
+
+    def test_week_is_saved_in_bulk(self):
+        second = Task.objects.create(name='Вторая', project=self.project)
+        approved = Timesheet.objects.create(
+            employee=self.employee, task=self.task, date=date(2025, 1, 6), hours=4, status='approved',
+        )
+        pending = Timesheet.objects.create(employee=self.employee, task=second, date=date(2025, 1, 7), hours=2)
+        self.client.force_login(self.user)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['week_start'], date(2025, 1, 6))
+        self.assertEqual(len(response.context['rows']), 2)
+
+        response = self.post_grid([
+            (second, ['', '', '8', '8', '', '', '']),        # удалить 07.01, создать 08.01 и 09.01
+            (self.task, ['9', '7.5', '', '', '6', '', '']),  # 06.01 одобрена — не меняется
+        ])
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Timesheet.objects.filter(pk=pending.pk).exists())
+        self.assertEqual(Timesheet.objects.get(pk=approved.pk).hours, 4)
+        self.assertEqual(Timesheet.objects.filter(employee=self.employee).count(), 5)
+        self.assertEqual(EmployeeStats.objects.get().total_hours, Decimal('33.5'))
+        self.assertEqual(stats.find_drift(), {})
+
+        entry = Timesheet.objects.get(task=self.task, date=date(2025, 1, 7))
+        self.post_grid([
+            (second, ['', '', '8', '8', '', '', '']),
+            (self.task, ['', '5', '', '', '6', '', '']),
+        ])
+        entry.refresh_from_db()
+        self.assertEqual(entry.hours, 5)
+        self.assertEqual(stats.find_drift(), {})
+
+    @override_settings(QUERY_BUDGET_STRICT=False)
+    def test_clearing_cells_does_not_grow_queries(self):
+        self.client.force_login(self.user)
+        self.client.get(self.url)  # прогрев кеша ролей и списков
+        counts = []
+        for days in (1, 7):
+            Timesheet.objects.bulk_create(
+                Timesheet(employee=self.employee, task=self.task, date=date(2025, 1, 6) + timedelta(days=i), hours=2)
+                for i in range(days)
+            )
+            call_command('rebuild_employee_stats', stdout=StringIO())
+            ledger.rebuild(employee_id=self.employee.pk)
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.post_grid([(self.task, [''] * 7)])
+            self.assertEqual(response.status_code, 302)
+            counts.append(len(ctx))
+        self.assertEqual(counts[0], counts[1])
+        self.assertLessEqual(counts[1], 24)  # @query_budget(24)
+        self.assertFalse(Timesheet.objects.exists())
+        self.assertEqual(stats.find_drift(), {})
+        self.assertEqual(ledger.find_drift(), {})
+
+    def test_day_total_is_validated_across_rows(self):
+        second = Task.objects.create(name='Вторая', project=self.project)
+        self.client.force_login(self.user)
+        response = self.post_grid([
+            (second, ['20', '', '', '', '', '', '']),
+            (self.task, ['5', '', '', '', '', '', '']),
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['formset'].non_form_errors())
+        self.assertFalse(Timesheet.objects.exists())
+
+
+class SeedAndBenchmarkTests(TestCase):
+    def test_seed_then_benchmark(self):
+        call_command('seed_timesheets', employees=3, projects=2, years=0.1, stdout=StringIO())
+        self.assertGreater(Timesheet.objects.count(), 0)
+        self.assertEqual(stats.find_drift(), {})
+        self.assertEqual(ledger.find_drift(), {})
+
+        # Чужая задача в очереди: замер не должен её выполнить или оставить своих
+        queued = jobs.enqueue('report_email', user_id=0)
+        cache.set('timesheet:sentinel', 1)
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'bench.json')
+            call_command('benchmark_views', output=output, repeat=1, stdout=StringIO())
+            with open(output, encoding='utf-8') as f:
+                runs = json.load(f)
+        results = runs[0]['results']
+        self.assertTrue(all(result['status'] in (200, 302, 0) for result in results))
+        self.assertTrue(all(result['queries'] > 0 for result in results))
+        self.assertFalse(runs[0]['warm_cache'])
+
+        self.assertEqual(list(Job.objects.values_list('pk', 'status')), [(queued.pk, 'queued')])
+        self.assertFalse(ExportJob.objects.exists())
+        self.assertEqual(cache.get('timesheet:sentinel'), 1)
+
+
+class SQLProfilingTests(TimesheetTestCase):
+    def test_server_timing_for_staff(self):
+        self.add_timesheets(3)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        # Строка должна проходить через уровень, настроенный в LOGGING, а не только в тесте
+        configured = settings.LOGGING['loggers']['timesheet.middleware']['level']
+        self.assertTrue(logging.getLogger('timesheet.middleware').isEnabledFor(logging.getLevelName(configured)))
+        with self.assertLogs('timesheet.middleware', configured) as logs:
+            response = self.client.get(reverse('timesheet_list'))
+        self.assertRegex(response['Server-Timing'], r'^sql;dur=[\d.]+;desc="\d+ queries", sql-1;dur=')
+        self.assertIn('INFO:timesheet.middleware:GET /timesheet/', logs.output[0])
+
+    @override_settings(SQL_PROFILING_SLOW_MS=0)
+    def test_slow_requests_are_warnings(self):
+        self.manager.is_staff = True
+        self.manager.save()
+        self.client.force_login(self.manager)
+        with self.assertLogs('timesheet.middleware', 'WARNING'):
+            self.client.get(reverse('timesheet_list'))
+
+    def test_streamed_body_queries_are_counted(self):
+        self.add_timesheets(3, status='approved')
+        self.manager.is_staff = True
+        self.manager.save()
+        self.client.force_login(self.manager)
+        url = reverse('export_excel')
+        with self.assertLogs('timesheet.middleware', 'INFO') as logs:
+            response = self.client.get(url, {'format': 'csv'})
+            self.assertEqual(logs.output, [])  # тело ещё не прочитано
+            with CaptureQueriesContext(connection) as ctx:
+                b''.join(response.streaming_content)
+        body_queries = len(ctx.captured_queries)
+        self.assertGreater(body_queries, 0)
+        head_queries = int(response['Server-Timing'].split('desc="')[1].split(' ')[0])
+        self.assertRegex(logs.output[0], rf': {head_queries + body_queries} SQL-запросов, .* \(с потоковым телом\)')
+
+    def test_no_header_for_regular_user(self):
+        self.client.force_login(self.user)
+        self.assertNotIn('Server-Timing', self.client.get(reverse('timesheet_list')))
+
+    @override_settings(SQL_PROFILING=False)
+    def test_disabled(self):
+        self.user.is_staff = True
+        self.user.save()
+        client = Client()
+        client.force_login(self.user)
+        self.assertNotIn('Server-Timing', client.get(reverse('timesheet_list')))
+
+
+class TaskChoicesTests(TimesheetTestCase):
+    def test_choices_are_scoped_and_cached(self):
+        other_project = Project.objects.create(name='Чужой')
+        Task.objects.create(name='Чужая', project=other_project)
+
+        form = TimesheetForm(employee_id=self.employee.pk)
+        self.assertEqual([label for _, label in form.fields['task'].choices][1:], ['Задача (Проект)'])
+        with self.assertNumQueries(0):
+            TimesheetForm(employee_id=self.employee.pk).fields['task'].choices
+
+        # Добавление в проект сбрасывает кеш
+        other_project.employees.add(self.employee)
+        form = TimesheetForm(employee_id=self.employee.pk)
+        self.assertEqual(len(form.fields['task'].choices), 3)
+
+    def test_foreign_task_is_rejected(self):
+        foreign = Task.objects.create(name='Чужая', project=Project.objects.create(name='Чужой'))
+        form = TimesheetForm(
+            {'task': foreign.pk, 'date': '2025-01-06', 'hours': '8'}, employee_id=self.employee.pk,
+        )
+        self.assertIn('task', form.errors)
+
+    @override_settings(TASK_CHOICES_LIMIT=1)
+    def test_autocomplete_for_large_lists(self):
+        Task.objects.create(name='Вторая', project=self.project)
+        form = TimesheetForm(employee_id=self.employee.pk)
+        self.assertEqual(form.fields['task'].choices, [('', '---------')])
+        self.assertIn('data-autocomplete-url', str(form['task']))
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('task_autocomplete'), {'q': 'Втор'})
+        self.assertEqual([item['text'] for item in response.json()['results']], ['Вторая (Проект)'])
+
+
+class ApiTests(TimesheetTestCase):
+    def send(self, method, name, payload):
+        return getattr(self.client, method)(reverse(name), json.dumps(payload), content_type='application/json')
+
+    def test_sparse_fields_and_cursor(self):
+        self.add_timesheets(5)
+        self.client.force_login(self.manager)
+        self.client.get(reverse('api_timesheets'))  # прогрев кеша ролей и списков
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('api_timesheets'), {'fields': 'date,hours', 'page_size': 3})
+        body = response.json()
+        self.assertEqual(body['results'][0], {'date': '2025-01-06', 'hours': '8.00'})
+        # Только запрошенные колонки, без JOIN
+        select = ctx.captured_queries[-1]['sql']
+        self.assertNotIn('JOIN', select)
+        self.assertNotIn('notes', select)
+
+        body = self.client.get(body['next']).json()
+        self.assertEqual([row['date'] for row in body['results']], ['2025-01-09', '2025-01-10'])
+        self.assertIsNone(body['next'])
+
+    def test_unknown_field_and_scope(self):
+        self.add_timesheets(2)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('api_timesheets'), {'fields': 'date,password'})
+        self.assertEqual(response.status_code, 400)
+        other = Employee.objects.create(user=User.objects.create_user('other'))
+        Timesheet.objects.create(employee=other, task=self.task, date=date(2025, 1, 6), hours=1)
+        response = self.client.get(reverse('api_timesheets'), {'fields': 'employee'})
+        self.assertEqual({row['employee'] for row in response.json()['results']}, {self.employee.pk})
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api_employees')).status_code, 401)
+
+    def test_batch_create_is_all_or_nothing(self):
+        self.client.force_login(self.user)
+        foreign = Task.objects.create(name='Чужая', project=Project.objects.create(name='Чужой'))
+        response = self.send('post', 'api_timesheets', [
+            {'task': self.task.pk, 'date': '2025-01-06', 'hours': 8},
+            {'task': foreign.pk, 'date': '2025-01-07', 'hours': 8},
+            {'task': self.task.pk, 'date': 'завтра', 'hours': 30},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'1', '2'})
+        self.assertFalse(Timesheet.objects.exists())
+
+        response = self.send('post', 'api_timesheets', [
+            {'task': self.task.pk, 'date': f'2025-01-0{day}', 'hours': 4} for day in range(6, 9)
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['created']), 3)
+        self.assertEqual(EmployeeStats.objects.get().total_hours, 12)
+
+    def test_batch_update_and_approval(self):
+        entries = self.add_timesheets(3)
+        self.client.force_login(self.user)
+        response = self.send('patch', 'api_timesheets', [{'id': entries[0].pk, 'hours': 6}, {'id': entries[1].pk, 'status': 'approved'}])
+        self.assertEqual(response.status_code, 400)
+        response = self.send('patch', 'api_timesheets', [{'id': entries[0].pk, 'hours': 6, 'notes': 'правка'}])
+        self.assertEqual(response.json(), {'updated': 1})
+        self.assertEqual(Timesheet.objects.get(pk=entries[0].pk).hours, 6)
+
+        self.client.force_login(self.manager)
+        response = self.send('patch', 'api_timesheets', [{'id': ts.pk, 'status': 'approved'} for ts in entries])
+        self.assertEqual(response.json(), {'updated': 0, 'approved': 3})
+        self.assertEqual(EmployeeStats.objects.get().approved_hours, 22)
+
+    def test_manager_creates_tasks(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.send('post', 'api_tasks', [{'name': 'Новая', 'project': self.project.pk}]).status_code, 403)
+        self.client.force_login(self.manager)
+        response = self.send('post', 'api_tasks', [{'name': 'Новая', 'project': self.project.pk}])
+        self.assertEqual(response.status_code, 201)
+        names = [row['name'] for row in self.client.get(reverse('api_tasks'), {'fields': 'name'}).json()['results']]
+        self.assertEqual(names, ['Задача', 'Новая'])
+
+
+class ImportTests(TimesheetTestCase):
+    CSV = (
+        'employee;project;task;date;hours;status\n'
+        'worker;Проект;Задача;2025-01-06;8;\n'
+        'worker;проект;задача;07.01.2025;7,5;Одобрено\n'
+        'nobody;Проект;Задача;2025-01-08;8;\n'
+        'worker;Проект;Нет такой;2025-01-09;30;\n'
+        ';;;;;\n'
+    )
+
+    def test_command_imports_in_batches_and_writes_rejects(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'legacy.csv')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self.CSV)
+            out = StringIO()
+            call_command('import_timesheets', path, batch_size=1, stdout=out)
+            self.assertIn('Импортировано записей: 2', out.getvalue())
+            with open(path + '.rejects.csv', encoding='utf-8-sig') as f:
+                rejects = f.read().splitlines()
+
+        self.assertEqual([line.split(',')[0] for line in rejects], ['line', '4', '5'])
+        self.assertIn('hours', rejects[2])
+        approved = Timesheet.objects.get(status='approved')
+        self.assertEqual((approved.date, approved.salary_amount), (date(2025, 1, 7), Decimal('150.00')))
+        # Производные данные пересчитаны после bulk_create
+        self.assertEqual(EmployeeStats.objects.get().total_hours, Decimal('15.5'))
+        self.assertEqual(WeeklyHours.objects.get().approved_hours, Decimal('7.5'))
+
+    def test_upload_xlsx(self):
+        wb = Workbook()
+        wb.active.append(['Сотрудник', 'Проект', 'Задача', 'Дата', 'Часы'])
+        wb.active.append(['worker', 'Проект', 'Задача', datetime(2025, 1, 6), 8])
+        wb.active.append(['worker', 'Проект', 'Задача', 'вчера', 8])
+        content = BytesIO()
+        wb.save(content)
+
+        self.client.force_login(self.manager)
+        upload = SimpleUploadedFile('legacy.xlsx', content.getvalue())
+        response = self.client.post(reverse('timesheet_import'), {'file': upload})
+        self.assertEqual(response.context['result'].created, 1)
+        self.assertEqual([row[0] for row in response.context['rejects']], [3])
+        self.assertEqual(Timesheet.objects.count(), 1)
+
+    def test_missing_columns(self):
+        self.client.force_login(self.manager)
+        upload = SimpleUploadedFile('legacy.csv', 'employee,date\nworker,2025-01-06\n'.encode())
+        response = self.client.post(reverse('timesheet_import'), {'file': upload})
+        self.assertIn('Нет обязательных столбцов', response.context['form'].errors['file'][0])
+
+    def test_corrupted_xlsx_is_a_form_error(self):
+        self.client.force_login(self.manager)
+        upload = SimpleUploadedFile('legacy.xlsx', b'PK\x03\x04 not a workbook')
+        response = self.client.post(reverse('timesheet_import'), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('повреждён', response.context['form'].errors['file'][0])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'legacy.xlsx')
+            with open(path, 'wb') as f:
+                f.write(b'garbage')
+            with self.assertRaisesMessage(CommandError, 'повреждён'):
+                call_command('import_timesheets', path, stdout=StringIO())
+
+    def test_decode_error_midway_keeps_committed_batches_consistent(self):
+        # Больше одной пачки (IMPORT_BATCH_SIZE) до битого байта
+        lines = [
+            f'worker;Проект;Задача;{date(2018, 1, 1) + timedelta(days=i)};8;approved\n'
+            for i in range(2500)
+        ]
+        content = ('employee;project;task;date;hours;status\n' + ''.join(lines)).encode() + b'worker;\xff\n'
+
+        self.client.force_login(self.manager)
+        upload = SimpleUploadedFile('legacy.csv', content)
+        response = self.client.post(reverse('timesheet_import'), {'file': upload})
+        self.assertIn('UTF-8', response.context['form'].errors['file'][0])
+
+        saved = Timesheet.objects.count()
+        self.assertGreater(saved, 0)
+        self.assertContains(response, f'записей до ошибки сохранено: {saved}')
+        # Сохранённые пачки досчитаны: снимки зарплаты, итоги и недельный журнал
+        self.assertFalse(Timesheet.objects.filter(salary_amount__isnull=True).exists())
+        self.assertEqual(stats.find_drift(), {})
+        self.assertEqual(ledger.find_drift(), {})
+        self.assertEqual(self.client.get(reverse('report'), {'month': '2018-01'}).status_code, 200)
+
+
+class ConditionalGetTests(TimesheetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.entries = self.add_timesheets(2, status='approved')
+        self.client.force_login(self.manager)
+        self.client.get(reverse('timesheet_list'))  # CSRF-cookie входит в ETag — получаем её заранее
+
+    def test_list_not_modified_until_data_changes(self):
+        url = reverse('timesheet_list')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(3):  # сессия, пользователь, водяной знак
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.add_timesheets(1, start=date(2025, 3, 3))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pending_messages_are_not_swallowed(self):
+        url = reverse('timesheet_list')
+        etag = self.client.get(url)['ETag']
+        self.client.post(reverse('timesheet_bulk_approve'), {'ids': [], 'action': 'approve'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Не выбрано ни одной записи.')
+
+    def test_report_last_modified(self):
+        url = reverse('report')
+        response = self.client.get(url, {'month': '2025-01'})
+        last_modified = response['Last-Modified']
+        response = self.client.get(url, {'month': '2025-01'}, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        # Другой месяц — другой водяной знак
+        response = self.client.get(url, {'month': '2025-02'}, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+    def test_export_skips_workbook(self):
+        url = reverse('export_excel')
+        etag = self.client.get(url, {'month': '2025-01'})['ETag']
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, {'month': '2025-01'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(any('timesheet_timesheet' in q['sql'] for q in ctx.captured_queries))
+
+        self.entries[0].hours = 4
+        self.entries[0].save()
+        self.assertEqual(self.client.get(url, {'month': '2025-01'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+# Суперпользователь — staff: без этого каждая страница писала бы строку профилирования SQL
+@override_settings(SQL_PROFILING=False)
+class AdminTests(TimesheetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.force_login(self.admin)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        url = reverse('admin:timesheet_timesheet_changelist')
+        self.add_timesheets(2)
+        self.client.get(url)  # прогрев кэшей сессии и прав
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.add_timesheets(30, start=date(2024, 1, 1))
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(url)
+        self.assertEqual(len(many), len(few))
+
+    @override_settings(ADMIN_COUNT_LIMIT=3)
+    def test_changelist_count_is_capped(self):
+        self.add_timesheets(5)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin:timesheet_timesheet_changelist'))
+        self.assertEqual(response.context['cl'].result_count, 3)
+        counts = [q['sql'] for q in ctx.captured_queries if 'COUNT(' in q['sql'] and 'timesheet_timesheet' in q['sql']]
+        self.assertEqual(len(counts), 1)
+        self.assertIn('LIMIT 4', counts[0])
+        # Строк больше предела — число показано как нижняя граница
+        self.assertContains(response, '3+ timesheets')
+        # Без date_hierarchy: никакой выборки различных дат по всей таблице
+        self.assertFalse(any('DISTINCT' in q['sql'] for q in ctx.captured_queries))
+
+    @override_settings(ADMIN_COUNT_LIMIT=3)
+    def test_count_at_the_cap_is_exact(self):
+        self.add_timesheets(3)
+        response = self.client.get(reverse('admin:timesheet_timesheet_changelist'))
+        self.assertFalse(response.context['cl'].paginator.capped)
+        self.assertContains(response, '3 timesheets')
+        self.assertNotContains(response, '3+')
+
+    def test_bulk_approve_action(self):
+        entries = self.add_timesheets(3)
+        response = self.client.post(reverse('admin:timesheet_timesheet_changelist'), {
+            'action': 'approve_selected',
+            '_selected_action': [ts.pk for ts in entries[:2]],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Timesheet.objects.filter(status='approved').count(), 2)
+        self.assertEqual(EmployeeStats.objects.get().approved_hours, 16)
@@ -1,12 +1,22 @@
 from django.urls import path
+from .api import employees_api, projects_api, tasks_api, timesheets_api
 from .views import (
+    home_view,
     TimesheetListView,
     TimesheetCreateView,
+    timesheet_week_view,
+    task_autocomplete,
     TimesheetUpdateView,
     TimesheetDeleteView,
     approve_timesheet,
+    bulk_approve_timesheets,
     report_view,
     export_timesheets_excel,
+    start_export_job,
+    export_job_view,
+    export_job_status,
+    export_job_download,
+    import_timesheets_view,
     send_report_email,
 )
 
@@ -15,10 +25,22 @@ urlpatterns = [
     # URL: /timesheet/
     path('', TimesheetListView.as_view(), name='timesheet_list'),
 
+    # Главная панель со статистикой пользователя
+    # URL: /timesheet/home/
+    path('home/', home_view, name='home'),
+
     # Создание новой записи
     # URL: /timesheet/create/
     path('create/', TimesheetCreateView.as_view(), name='timesheet_create'),
 
+    # Недельная сетка: ввод записей за неделю одной формой
+    # URL: /timesheet/week/?week=YYYY-MM-DD
+    path('week/', timesheet_week_view, name='timesheet_week'),
+
+    # Поиск задач для формы записи (JSON), когда задач слишком много для списка
+    # URL: /timesheet/tasks/autocomplete/?q=...
+    path('tasks/autocomplete/', task_autocomplete, name='task_autocomplete'),
+
     # Редактирование записи
     # URL: /timesheet/<id>/update/
     path('<int:pk>/update/', TimesheetUpdateView.as_view(), name='timesheet_update'),
@@ -31,6 +53,10 @@ urlpatterns = [
     # URL: /timesheet/<id>/approve/
     path('<int:pk>/approve/', approve_timesheet, name='timesheet_approve'),
 
+    # Массовое одобрение/отклонение выбранных записей (только для менеджера)
+    # URL: /timesheet/bulk-approve/
+    path('bulk-approve/', bulk_approve_timesheets, name='timesheet_bulk_approve'),
+
     # Отчёт по часам и зарплате (с фильтром по месяцу)
     # URL: /timesheet/report/
     path('report/', report_view, name='report'),
@@ -39,7 +65,32 @@ urlpatterns = [
     # URL: /timesheet/export/
     path('export/', export_timesheets_excel, name='export_excel'),
 
+    # Фоновая выгрузка (для менеджера): POST ставит задачу, страница показывает прогресс
+    # URL: /timesheet/export/jobs/ — запуск (month=YYYY-MM или вся история)
+    path('export/jobs/', start_export_job, name='export_job_start'),
+    # URL: /timesheet/export/jobs/<id>/ — страница выгрузки
+    path('export/jobs/<int:pk>/', export_job_view, name='export_job'),
+    # URL: /timesheet/export/jobs/<id>/status/ — статус и прогресс (JSON)
+    path('export/jobs/<int:pk>/status/', export_job_status, name='export_job_status'),
+    # URL: /timesheet/export/jobs/<id>/download/ — готовый файл
+    path('export/jobs/<int:pk>/download/', export_job_download, name='export_job_download'),
+
+    # Импорт записей из CSV/XLSX (для менеджера)
+    # URL: /timesheet/import/
+    path('import/', import_timesheets_view, name='timesheet_import'),
+
     # Отправка отчёта на email (для менеджера)
     # URL: /timesheet/send-email/
     path('send-email/', send_report_email, name='send_report_email'),
+
+    # JSON API: чтение с курсором (?after=) и выбором полей (?fields=),
+    # запись пачками — POST (создание) и PATCH (изменение) с JSON-массивом
+    # URL: /timesheet/api/timesheets/ — записи (фильтры как у списка)
+    path('api/timesheets/', timesheets_api, name='api_timesheets'),
+    # URL: /timesheet/api/tasks/
+    path('api/tasks/', tasks_api, name='api_tasks'),
+    # URL: /timesheet/api/projects/
+    path('api/projects/', projects_api, name='api_projects'),
+    # URL: /timesheet/api/employees/ — только чтение
+    path('api/employees/', employees_api, name='api_employees'),
 ]
\ No newline at end of file
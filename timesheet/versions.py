@@ -0,0 +1,63 @@
+from django.db import transaction
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+
+from .models import MonthVersion
+
+# Область "все сотрудники" (сводные данные менеджера)
+ALL = 0
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def bump(keys):
+    """
+    Увеличить версии месяцев для пар (id сотрудника, любая дата месяца):
+    и область сотрудника, и общую. Недостающие строки создаются одним
+    INSERT ... ON CONFLICT DO NOTHING, затем один UPDATE на область.
+    """
+    months_by_scope = {}
+    for employee_id, day in keys:
+        for scope in (employee_id, ALL):
+            months_by_scope.setdefault(scope, set()).add(month_start(day))
+    if not months_by_scope:
+        return
+
+    now = timezone.now()
+    with transaction.atomic():
+        MonthVersion.objects.bulk_create(
+            [
+                MonthVersion(scope=scope, month=month, updated_at=now)
+                for scope, months in months_by_scope.items()
+                for month in months
+            ],
+            ignore_conflicts=True,
+        )
+        for scope, months in months_by_scope.items():
+            MonthVersion.objects.filter(scope=scope, month__in=months).update(
+                version=F('version') + 1, updated_at=now,
+            )
+
+
+def apply_changes(changes):
+    """Поднять версии месяцев по парам (было, стало) из Timesheet.snapshot()."""
+    bump(
+        (row['employee_id'], row['date'])
+        for change in changes
+        for row in change
+        if row is not None
+    )
+
+
+def watermark(scope, month=None):
+    """
+    (сумма версий, время последнего изменения) области — за месяц или за все месяцы.
+    Сумма версий растёт при любом изменении, поэтому годится для ETag.
+    """
+    rows = MonthVersion.objects.filter(scope=scope)
+    if month is not None:
+        rows = rows.filter(month=month_start(month))
+    result = rows.aggregate(version=Sum('version'), updated_at=Max('updated_at'))
+    return result['version'] or 0, result['updated_at']
@@ -1,51 +1,102 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.contrib.auth.decorators import user_passes_test
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.urls import reverse_lazy
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.urls import reverse, reverse_lazy
+from django.db.models import Q, Subquery
+from django.http import FileResponse, Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
-from django.utils.dateparse import parse_date
-from dateutil.relativedelta import relativedelta
-
-from datetime import datetime
-from openpyxl import Workbook
-from openpyxl.styles import Font
-
-from .models import Timesheet, Employee
-from .forms import TimesheetForm
-
-
+from django.utils.decorators import method_decorator
+from django.utils.http import content_disposition_header
+from django.views.decorators.http import require_POST
+
+import tempfile
+from datetime import date, timedelta
+
+from . import versions
+from .models import Timesheet, Employee, EmployeeStats, ExportJob, Task
+from .approval import change_status
+from .choices import choices_version, employee_tasks, task_label
+from .conditional import conditional
+from .export_cache import cached_workbook, is_closed, month_fingerprint
+from .exports import (
+    WRITERS, XLSX_CONTENT_TYPE, StreamingExportWriter, export_filename, export_pipeline, export_queryset,
+    request_export, write_export,
+)
+from .forms import DAY_NAMES, TimesheetFilterForm, TimesheetForm, TimesheetImportForm, WeekGridFormSet
+from .importer import ImportFormatError, ImportResult, import_timesheets, read_rows, reject_row
+from .jobs import enqueue
+from .pagination import cursor_state, paginate_keyset
+from .querycount import query_budget
+from .reports import cached_salary_summary, month_bounds
+from .roles import is_manager
+from .weekgrid import WeekGrid
+
+
+@query_budget(4)
 def home_view(request):
     if request.user.is_authenticated:
-        total_timesheets = Timesheet.objects.filter(employee__user=request.user).count()
-        total_hours = Timesheet.objects.filter(employee__user=request.user).aggregate(Sum('hours'))['hours__sum'] or 0
-        context = {'total_timesheets': total_timesheets, 'total_hours': total_hours}
+        # Итоги хранятся в EmployeeStats и обновляются при каждом изменении записей
+        employee_stats = EmployeeStats.objects.filter(employee__user=request.user).first()
+        context = {
+            'stats': employee_stats,
+            'total_timesheets': employee_stats.entry_count if employee_stats else 0,
+            'total_hours': employee_stats.total_hours if employee_stats else 0,
+        }
     else:
         context = {}
     return render(request, 'home.html', context)
 
 
-# Проверка на менеджера (группа Managers)
-def is_manager(user):
-    return user.groups.filter(name='Managers').exists()
+def _version_scope(user):
+    """Область версий данных пользователя: все сотрудники для менеджера, иначе — свой."""
+    if is_manager(user):
+        return versions.ALL, 'all'
+    return Subquery(Employee.objects.filter(user=user).values('pk')[:1]), f'user{user.pk}'
 
 
+def _list_state(request):
+    if not request.user.is_authenticated:
+        return None
+    scope, scope_key = _version_scope(request.user)
+    version, updated_at = versions.watermark(scope)
+    return ('list', scope_key, version, choices_version()), updated_at
+
+
+@method_decorator(conditional(_list_state), name='dispatch')
+@method_decorator(query_budget(8), name='dispatch')
 class TimesheetListView(LoginRequiredMixin, ListView):
     model = Timesheet
     template_name = 'timesheet_list.html'
     context_object_name = 'timesheets'
 
-    def get_queryset(self):
+    def get_filter_form(self):
+        # При переходе по страницам фильтры берутся из курсора, а не из GET
+        data = cursor_state(self.request.GET)
+        if data is None:
+            data = self.request.GET
         if is_manager(self.request.user):
-            return Timesheet.objects.all().order_by('-date')
-        return Timesheet.objects.filter(employee__user=self.request.user).order_by('-date')
+            return TimesheetFilterForm(data)
+        employee_id = Employee.objects.filter(user=self.request.user).values_list('pk', flat=True).first()
+        return TimesheetFilterForm(data, employee_id=employee_id or 0)
+
+    def get_queryset(self):
+        self.filter_form = self.get_filter_form()
+        # Шаблон читает сотрудника, проект и задачу каждой строки — грузим их одним JOIN
+        queryset = Timesheet.objects.select_related('employee__user', 'task__project')
+        if not is_manager(self.request.user):
+            queryset = queryset.filter(employee__user=self.request.user)
+        return self.filter_form.filter(queryset).order_by('-date', '-id')
 
     def get_context_data(self, **kwargs):
+        # Курсорная пагинация вместо выгрузки всей таблицы на одну страницу
+        page = paginate_keyset(self.object_list, self.request.GET, state=self.filter_form.state())
+        kwargs['object_list'] = page.object_list
         context = super().get_context_data(**kwargs)
-        context['is_manager'] = is_manager(self.request.user)
+        context['page'] = page
+        context['filter_form'] = self.filter_form
+        context['is_filtered'] = bool(self.filter_form.filters())
         return context
 
 
@@ -55,6 +106,13 @@ class TimesheetCreateView(LoginRequiredMixin, CreateView):
     template_name = 'timesheet_form.html'
     success_url = reverse_lazy('timesheet_list')
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['employee_id'] = (
+            Employee.objects.filter(user=self.request.user).values_list('pk', flat=True).first()
+        )
+        return kwargs
+
     def form_valid(self, form):
         employee, created = Employee.objects.get_or_create(
             user=self.request.user,
@@ -74,6 +132,11 @@ class TimesheetUpdateView(LoginRequiredMixin, UpdateView):
     def get_queryset(self):
         return Timesheet.objects.filter(employee__user=self.request.user)
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['employee_id'] = self.object.employee_id
+        return kwargs
+
     def form_valid(self, form):
         messages.success(self.request, 'Запись успешно обновлена.')
         return super().form_valid(form)
@@ -85,16 +148,70 @@ class TimesheetDeleteView(LoginRequiredMixin, DeleteView):
     success_url = reverse_lazy('timesheet_list')
 
     def get_queryset(self):
-        return Timesheet.objects.filter(employee__user=self.request.user)
+        return Timesheet.objects.filter(employee__user=self.request.user).select_related('employee__user', 'task__project')
 
     def delete(self, request, *args, **kwargs):
         messages.success(request, 'Запись успешно удалена.')
         return super().delete(request, *args, **kwargs)
 
 
+# Поиск задач для формы записи, когда их слишком много для выпадающего списка
+@login_required
+def task_autocomplete(request):
+    query = request.GET.get('q', '').strip()
+    employee_id = Employee.objects.filter(user=request.user).values_list('pk', flat=True).first()
+    tasks = employee_tasks(employee_id) if employee_id else Task.objects.none()
+    if query:
+        tasks = tasks.filter(Q(name__icontains=query) | Q(project__name__icontains=query))
+    rows = tasks.order_by('project__name', 'name').values_list('pk', 'name', 'project__name')[:20]
+    return JsonResponse({
+        'results': [{'id': pk, 'text': task_label(name, project_name)} for pk, name, project_name in rows],
+    })
+
+
+# Недельная сетка: все записи недели (задачи × дни) одной формой
+@login_required
+@query_budget(24)
+def timesheet_week_view(request):
+    try:
+        selected = date.fromisoformat(request.GET.get('week', ''))
+    except ValueError:
+        selected = timezone.localdate()
+    week_start = selected - timedelta(days=selected.weekday())
+
+    employee, created = Employee.objects.get_or_create(
+        user=request.user,
+        defaults={'hourly_rate': 10.00}
+    )
+    grid = WeekGrid(employee, week_start)
+
+    if request.method == 'POST':
+        formset = WeekGridFormSet(request.POST, initial=grid.initial())
+        if formset.is_valid():
+            created_count, updated_count, deleted_count = grid.save(formset)
+            messages.success(
+                request,
+                f'Неделя сохранена: добавлено {created_count}, изменено {updated_count}, удалено {deleted_count}.'
+            )
+            return redirect(f"{reverse('timesheet_week')}?week={week_start.isoformat()}")
+    else:
+        formset = WeekGridFormSet(initial=grid.initial())
+
+    context = {
+        'formset': formset,
+        'rows': list(grid.rows(formset)),
+        'days': list(zip(DAY_NAMES, grid.days)),
+        'week_start': week_start,
+        'prev_week': (week_start - timedelta(days=7)).isoformat(),
+        'next_week': (week_start + timedelta(days=7)).isoformat(),
+    }
+    return render(request, 'timesheet_week.html', context)
+
+
 @user_passes_test(is_manager, login_url='timesheet_list')
+@query_budget(4)
 def approve_timesheet(request, pk):
-    ts = get_object_or_404(Timesheet, pk=pk)
+    ts = get_object_or_404(Timesheet.objects.select_related('employee__user', 'task__project'), pk=pk)
 
     if request.method == 'POST':
         action = request.POST.get('action')
@@ -112,143 +229,217 @@ def approve_timesheet(request, pk):
     return render(request, 'approve_form.html', {'ts': ts})
 
 
+# Массовое одобрение/отклонение отмеченных в списке записей (только для менеджера)
+@user_passes_test(is_manager, login_url='timesheet_list')
+@require_POST
+def bulk_approve_timesheets(request):
+    ids = [pk for pk in request.POST.getlist('ids') if pk.isdigit()]
+    action = request.POST.get('action')
+
+    if not ids:
+        messages.warning(request, 'Не выбрано ни одной записи.')
+    elif action == 'approve':
+        count = change_status(ids, 'approved')
+        messages.success(request, f'Одобрено записей: {count}.')
+    elif action == 'reject':
+        count = change_status(ids, 'rejected')
+        messages.error(request, f'Отклонено записей: {count}.')
+    else:
+        messages.warning(request, 'Неизвестное действие.')
+    return redirect('timesheet_list')
+
+
+def _report_watermark(request, start_date):
+    # Один запрос на обращение: нужен и для ETag, и для ключа кеша итогов
+    if not hasattr(request, '_report_watermark'):
+        scope, scope_key = _version_scope(request.user)
+        request._report_watermark = (scope_key, *versions.watermark(scope, start_date))
+    return request._report_watermark
+
+
+def _report_state(request):
+    start_date, _ = month_bounds(request.GET.get('month', timezone.now().strftime('%Y-%m')))
+    scope_key, version, updated_at = _report_watermark(request, start_date)
+    return ('report', start_date, scope_key, version, choices_version()), updated_at
+
+
 # Отчёт по месяцам (для всех — свои, для менеджера — всех)
+@login_required
+@conditional(_report_state)
+@query_budget(6)
 def report_view(request):
     month_str = request.GET.get('month', timezone.now().strftime('%Y-%m'))
-    selected_date = parse_date(f"{month_str}-01") or timezone.now().replace(day=1)
-    
-    start_date = selected_date
-    end_date = selected_date + relativedelta(months=1) - relativedelta(days=1)
+    start_date, end_date = month_bounds(month_str)
+    month_str = start_date.strftime('%Y-%m')
 
     queryset = Timesheet.objects.filter(
         status='approved',
         date__range=(start_date, end_date)
-    ).select_related('employee__user', 'task__project')
+    )
 
     if not is_manager(request.user):
         queryset = queryset.filter(employee__user=request.user)
-    
-    total_hours = queryset.aggregate(Sum('hours'))['hours__sum'] or 0
-    total_salary = sum(ts.total_salary for ts in queryset)
+
+    # Итоги — из кеша по версии месяца (иначе один агрегирующий запрос) + одна страница строк
+    scope_key, version, _ = _report_watermark(request, start_date)
+    summary = cached_salary_summary(queryset, start_date, end_date, scope_key, version)
+    page = paginate_keyset(
+        queryset.select_related('employee__user', 'task__project'),
+        request.GET,
+        extra_params={'month': month_str},
+    )
 
     context = {
-        'timesheets': queryset.order_by('-date'),
-        'total_hours': total_hours,
-        'total_salary': total_salary,
+        'timesheets': page.object_list,
+        'page': page,
+        'total_hours': summary['total_hours'],
+        'total_salary': summary['total_salary'],
+        'by_employee': summary['by_employee'],
+        'by_project': summary['by_project'],
         'selected_month': month_str,
-        'is_manager': is_manager(request.user),
     }
     return render(request, 'report.html', context)
 
 
-# Экспорт в Excel — только для менеджера
+# Экспорт (только для менеджера): ?format=xlsx (по умолчанию), csv или jsonl
+def _export_state(request):
+    export_format = request.GET.get('format', 'xlsx')
+    if export_format not in WRITERS:
+        return None
+    month_str = request.GET.get('month')
+    if month_str:
+        start_date, _ = month_bounds(month_str)
+        version, updated_at = versions.watermark(versions.ALL, start_date)
+        return ('export', export_format, start_date, version, choices_version()), updated_at
+    # В имени полного файла — дата выгрузки
+    version, updated_at = versions.watermark(versions.ALL)
+    return ('export', export_format, timezone.localdate(), version, choices_version()), updated_at
+
+
 @user_passes_test(is_manager, login_url='timesheet_list')
+@conditional(_export_state)
 def export_timesheets_excel(request):
+    writer_class = WRITERS.get(request.GET.get('format', 'xlsx'))
+    if writer_class is None:
+        return HttpResponseBadRequest(f'Неизвестный формат. Доступны: {", ".join(WRITERS)}.')
     month_str = request.GET.get('month')
-    if month_str:
-        selected_date = parse_date(f"{month_str}-01")
-        start_date = selected_date
-        end_date = selected_date + relativedelta(months=1) - relativedelta(days=1)
-        timesheets = Timesheet.objects.filter(
-            status='approved',
-            date__range=(start_date, end_date)
-        ).select_related('employee__user', 'task__project')
-        filename = f"timesheet_{month_str}.xlsx"
+    month = month_bounds(month_str)[0] if month_str else None
+    timesheets = export_queryset(month)
+    filename = export_filename(month, extension=writer_class.extension)
+
+    if issubclass(writer_class, StreamingExportWriter):
+        # CSV и JSON Lines пишутся прямо в ответ, порциями, без промежуточного файла
+        rows, totals = export_pipeline(timesheets)
+        response = StreamingHttpResponse(writer_class().chunks(rows, totals), content_type=writer_class.content_type)
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        return response
+
+    if month is not None and is_closed(month):
+        # Закрытый месяц меняется редко — книга берётся из кеша по отпечатку данных
+        output = cached_workbook(
+            month_fingerprint(timesheets, month),
+            lambda fileobj: write_export(timesheets, fileobj, writer_class),
+        )
     else:
-        timesheets = Timesheet.objects.filter(status='approved').select_related('employee__user', 'task__project')
-        filename = f"timesheet_full_{datetime.now().strftime('%Y%m%d')}.xlsx"
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Таймшит"
-
-    headers = ['Сотрудник', 'Проект', 'Задача', 'Дата', 'Часы', 'Ставка', 'Зарплата']
-    ws.append(headers)
-    for cell in ws[1]:
-        cell.font = Font(bold=True)
-
-    total_salary = 0
-    for ts in timesheets:
-        salary = ts.total_salary
-        total_salary += salary
-        ws.append([
-            ts.employee.user.get_full_name() or ts.employee.user.username,
-            ts.task.project.name,
-            ts.task.name,
-            ts.date.strftime("%d.%m.%Y"),
-            float(ts.hours),
-            float(ts.employee.hourly_rate),
-            float(salary),
-        ])
-
-    ws.append([])
-    ws.append(['ИТОГО ЗАРПЛАТА:', '', '', '', '', '', total_salary])
-
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        # Книга собирается на диске, а клиенту отдаётся потоково, блоками
+        output = tempfile.TemporaryFile()
+        write_export(timesheets, output, writer_class)
+        output.seek(0)
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=filename,
+        content_type=writer_class.content_type,
     )
-    response['Content-Disposition'] = f'attachment; filename={filename}'
-    wb.save(response)
-    return response
 
-from django.core.mail import EmailMessage
 
+# Фоновая выгрузка: запрос только ставит задачу (или находит готовую с теми же
+# параметрами и данными), страница выгрузки опрашивает статус и даёт скачать файл
 @user_passes_test(is_manager, login_url='timesheet_list')
-def send_report_email(request):
-    # Получаем данные как в salary_report или report_view
-    # Используем текущий месяц или все одобренные
-    timesheets = Timesheet.objects.filter(status='approved').select_related('employee__user', 'task__project')
-
-    # Собираем текст отчёта
-    report_lines = [
-        "ОТЧЁТ ПО РАБОЧИМ ЧАСАМ И ЗАРПЛАТЕ",
-        "=" * 50,
-        ""
-    ]
-
-    total_hours_all = 0
-    total_salary_all = 0
-
-    current_employee = None
-    for ts in timesheets.order_by('employee__user__username', '-date'):
-        if current_employee != ts.employee:
-            if current_employee is not None:
-                report_lines.append("")
-            current_employee = ts.employee
-            employee_name = ts.employee.user.get_full_name() or ts.employee.user.username
-            report_lines.append(f"Сотрудник: {employee_name}")
-            report_lines.append(f"Ставка: {ts.employee.hourly_rate} ₽/ч")
-            report_lines.append("-" * 40)
-
-        salary = ts.total_salary
-        total_hours_all += float(ts.hours)
-        total_salary_all += float(salary)
-
-        report_lines.append(
-            f"{ts.date.strftime('%d.%m.%Y')} | {ts.task.project.name} → {ts.task.name} | {ts.hours} ч | {salary} ₽"
-        )
+@require_POST
+def start_export_job(request):
+    month_str = request.POST.get('month')
+    month = month_bounds(month_str)[0] if month_str else None
+    export, created = request_export(request.user, month)
+    if not created:
+        messages.info(request, 'Такая выгрузка уже есть — данные с тех пор не менялись.')
+    return redirect('export_job', pk=export.pk)
 
-    report_lines.extend([
-        "",
-        "=" * 50,
-        f"ИТОГО ЧАСОВ: {total_hours_all}",
-        f"ИТОГО ЗАРПЛАТА: {total_salary_all} ₽",
-        "",
-        f"Отчёт сформирован {datetime.now().strftime('%d.%m.%Y в %H:%M')}",
-    ])
-
-    report_text = "\n".join(report_lines)
-
-    # Отправляем письмо
-    email = EmailMessage(
-        subject='Отчёт по таймшиту',
-        body=report_text,
-        from_email=None,  # использует DEFAULT_FROM_EMAIL
-        to=[request.user.email],  # на email менеджера
-        reply_to=[request.user.email],
-    )
 
-    email.send()
+@user_passes_test(is_manager, login_url='timesheet_list')
+def export_job_view(request, pk):
+    export = get_object_or_404(ExportJob.objects.select_related('job'), pk=pk)
+    return render(request, 'export_job.html', {'export': export, 'status': _export_job_status(export)})
+
+
+def _export_job_status(export):
+    status = export.effective_status
+    return {
+        'id': export.pk,
+        'status': status,
+        'status_display': dict(ExportJob.STATUS_CHOICES)[status],
+        'rows_done': export.rows_done,
+        'rows_total': export.rows_total,
+        'error': export.error or (export.job.last_error if status != export.status else ''),
+        'download': reverse('export_job_download', args=[export.pk]) if status == 'done' else None,
+    }
+
+
+@user_passes_test(is_manager, login_url='timesheet_list')
+def export_job_status(request, pk):
+    return JsonResponse(_export_job_status(get_object_or_404(ExportJob.objects.select_related('job'), pk=pk)))
+
+
+@user_passes_test(is_manager, login_url='timesheet_list')
+def export_job_download(request, pk):
+    export = get_object_or_404(ExportJob, pk=pk, status='done')
+    try:
+        output = export.path.open('rb')
+    except FileNotFoundError:
+        raise Http404('Файл выгрузки удалён — запустите выгрузку заново.')
+    return FileResponse(output, as_attachment=True, filename=export.download_name, content_type=XLSX_CONTENT_TYPE)
+
+
+# Импорт записей из файла (только для менеджера). Файл разбирается потоково;
+# на странице показываются первые отклонённые строки, полный отчёт —
+# у команды manage.py import_timesheets
+IMPORT_REJECTS_SHOWN = 100
+
+@user_passes_test(is_manager, login_url='timesheet_list')
+def import_timesheets_view(request):
+    result = None
+    rejects = []
+    form = TimesheetImportForm(request.POST or None, request.FILES or None)
+    if request.method == 'POST' and form.is_valid():
+        upload = form.cleaned_data['file']
+
+        def reject(*args):
+            if len(rejects) < IMPORT_REJECTS_SHOWN:
+                rejects.append(reject_row(*args))
+
+        progress = ImportResult()
+        try:
+            result = import_timesheets(read_rows(upload.file, upload.name), reject=reject, result=progress)
+        except (ImportFormatError, UnicodeDecodeError) as exc:
+            if isinstance(exc, UnicodeDecodeError):
+                form.add_error('file', 'CSV-файл должен быть в кодировке UTF-8.')
+            else:
+                form.add_error('file', str(exc))
+            # Пачки до ошибки уже записаны — об этом нужно сказать прямо
+            if progress.created:
+                messages.warning(request, f'Импорт прерван, но записей до ошибки сохранено: {progress.created}.')
+        else:
+            messages.success(request, f'Импортировано записей: {result.created}.')
+            if result.rejected:
+                messages.warning(request, f'Отклонено строк: {result.rejected}.')
+
+    return render(request, 'timesheet_import.html', {'form': form, 'result': result, 'rejects': rejects})
+
+
+@user_passes_test(is_manager, login_url='timesheet_list')
+def send_report_email(request):
+    # Отчёт собирается и отправляется воркером (manage.py run_jobs), а не в запросе
+    enqueue('report_email', user_id=request.user.pk)
 
-    messages.success(request, 'Отчёт успешно отправлен на вашу почту!')
-    return redirect('timesheet_list')
\ No newline at end of file
+    messages.success(request, 'Отчёт поставлен в очередь и скоро придёт на вашу почту!')
+    return redirect('timesheet_list')
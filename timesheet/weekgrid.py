@@ -0,0 +1,109 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Task, Timesheet
+from .signals import notify_timesheets_changed
+
+
+def week_days(week_start):
+    return [week_start + timedelta(days=day) for day in range(7)]
+
+
+class WeekGrid:
+    """
+    Недельная сетка сотрудника (задачи × дни): записи недели и задачи загружаются
+    двумя запросами, сохранение — одним bulk_create, одним bulk_update и одним DELETE.
+    Ячейка редактируется, если в ней нет записей или ровно одна ожидающая одобрения.
+    """
+
+    def __init__(self, employee, week_start):
+        self.employee = employee
+        self.days = week_days(week_start)
+
+        self.cells = defaultdict(list)
+        entries = Timesheet.objects.filter(employee=employee, date__range=(self.days[0], self.days[-1]))
+        for entry in entries:
+            self.cells[entry.task_id, entry.date].append(entry)
+
+        used_task_ids = {task_id for task_id, _ in self.cells}
+        self.tasks = list(
+            Task.objects.filter(Q(project__employees=employee) | Q(pk__in=used_task_ids))
+            .select_related('project')
+            .distinct()
+            .order_by('project__name', 'name')
+        )
+        self.tasks_by_id = {task.pk: task for task in self.tasks}
+
+    def editable_entry(self, task_id, day):
+        """(можно ли править ячейку, существующая запись или None)."""
+        entries = self.cells.get((task_id, day), [])
+        if not entries:
+            return True, None
+        if len(entries) == 1 and entries[0].status == 'pending':
+            return True, entries[0]
+        return False, None
+
+    def initial(self):
+        rows = []
+        for task in self.tasks:
+            row = {'task': task.pk}
+            for index, day in enumerate(self.days):
+                entries = self.cells.get((task.pk, day), [])
+                if entries:
+                    row[f'day_{index}'] = sum(entry.hours for entry in entries)
+            rows.append(row)
+        return rows
+
+    def rows(self, formset):
+        # Для шаблона: задача, форма строки и признак "только чтение" по каждой ячейке
+        for form in formset.forms:
+            task = self.tasks_by_id.get(form.initial.get('task'))
+            if task is None:
+                continue
+            cells = []
+            for index, day in enumerate(self.days):
+                editable, _ = self.editable_entry(task.pk, day)
+                cells.append((form[f'day_{index}'], editable, self.cells.get((task.pk, day), [])))
+            yield task, form, cells
+
+    def save(self, formset):
+        """Сохранить сетку в одной транзакции. Возвращает (создано, изменено, удалено)."""
+        to_create, to_update, to_delete, changes = [], [], [], []
+        seen = set()
+        for form in formset.forms:
+            task_id = form.cleaned_data['task']
+            if task_id not in self.tasks_by_id or task_id in seen:
+                continue
+            seen.add(task_id)
+            for day, value in zip(self.days, form.day_values()):
+                editable, entry = self.editable_entry(task_id, day)
+                if not editable:
+                    continue
+                if entry is None:
+                    if value:
+                        to_create.append(Timesheet(employee=self.employee, task_id=task_id, date=day, hours=value))
+                elif not value:
+                    to_delete.append(entry)
+                elif value != entry.hours:
+                    old = entry.snapshot()
+                    entry.hours = value
+                    to_update.append(entry)
+                    changes.append((old, entry.snapshot()))
+
+        with transaction.atomic():
+            if to_create:
+                Timesheet.objects.bulk_create(to_create)
+                changes.extend((None, entry.snapshot()) for entry in to_create)
+            if to_update:
+                Timesheet.objects.bulk_update(to_update, ['hours'])
+            if to_delete:
+                # Один DELETE без post_delete на каждую запись: на Timesheet никто не ссылается,
+                # а производные данные обновит общая пачка изменений ниже
+                Timesheet.objects.filter(pk__in=[entry.pk for entry in to_delete])._raw_delete(Timesheet.objects.db)
+                changes.extend((entry.snapshot(), None) for entry in to_delete)
+            # bulk_create/bulk_update/удаление обходят сигналы модели — сообщаем об изменениях одной пачкой
+            notify_timesheets_changed(changes)
+        return len(to_create), len(to_update), len(to_delete)
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'timesheet.middleware.SQLProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -63,6 +64,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'timesheet.context_processors.roles',
             ],
         },
     },
@@ -126,5 +128,77 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_REDIRECT_URL = '/timesheet/'
 LOGOUT_REDIRECT_URL = '/'
 
+# Размер страницы списка записей (можно переопределить через ?page_size=)
+TIMESHEET_PAGE_SIZE = 50
+TIMESHEET_MAX_PAGE_SIZE = 500
 
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
\ No newline at end of file
+# Максимум объектов в одном пакетном запросе JSON API (timesheet/api.py)
+API_MAX_BATCH = 500
+
+# Больше задач у сотрудника — в форме записи вместо списка поиск с автодополнением
+TASK_CHOICES_LIMIT = 200
+
+# Бюджет SQL-запросов на view (timesheet.querycount.query_budget): превышение —
+# предупреждение в лог. Исключение (True) — только в тестах (TimesheetTestCase):
+# оно возникает после того, как view уже записала данные, и отдаёт 500
+QUERY_BUDGET_STRICT = False
+
+# Профилирование SQL на каждый запрос (timesheet.middleware.SQLProfilingMiddleware):
+# заголовок Server-Timing и строка в логе для DEBUG или staff-пользователей.
+# При False middleware отключается целиком
+SQL_PROFILING = DEBUG
+SQL_PROFILING_SLOWEST = 5
+# Порог суммарного времени SQL на запрос, мс: выше — предупреждение в лог, ниже — INFO
+SQL_PROFILING_SLOW_MS = 500
+
+
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
+# Кеш: по умолчанию — в памяти процесса (LocMemCache), у каждого воркера свой.
+# Сброс ключей (роли, списки выбора) виден только в том процессе, где он сделан,
+# поэтому при нескольких воркерах нужен общий бэкенд, например
+# django.core.cache.backends.redis.RedisCache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+# Срок кеша ролей пользователя, сек. (timesheet.roles): при кеше в памяти процесса
+# это задержка, с которой другие воркеры замечают снятие роли. С общим кешем — можно час
+ROLES_CACHE_TIMEOUT = 60
+
+# Фоновые задачи (manage.py run_jobs): задержка перед первым повтором, сек.;
+# каждая следующая попытка ждёт вдвое дольше
+JOB_RETRY_BASE_DELAY = 30
+# Аренда взятой задачи, сек.: если воркер не завершил её и не продлил (jobs.heartbeat)
+# за это время, задача возвращается в очередь — значит, воркер упал
+JOB_LEASE_TIMEOUT = 15 * 60
+
+# Фоновые выгрузки в Excel (timesheet.exports): каталог файлов и срок их хранения, сек.
+EXPORT_ROOT = BASE_DIR / 'exports'
+EXPORT_FILE_TTL = 24 * 60 * 60
+
+# Кеш книг Excel за закрытые месяцы (timesheet.export_cache): каталог и бюджет
+# на диске, байт; сверх бюджета удаляются давно не запрошенные книги
+EXPORT_CACHE_ROOT = BASE_DIR / 'exports' / 'cache'
+EXPORT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Логи приложения (бюджет запросов, профилирование SQL, фоновые задачи) — в консоль
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'timesheet': {
+            'handlers': ['console'],
+            'level': 'INFO' if DEBUG else 'WARNING',
+        },
+        # Строка профилирования SQL пишется с уровнем INFO — раз профилирование
+        # включено (SQL_PROFILING), она нужна и без DEBUG
+        'timesheet.middleware': {
+            'level': 'INFO',
+        },
+    },
+}